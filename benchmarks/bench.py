@@ -0,0 +1,164 @@
+"""Time every phase of a run on synthetic exports
+
+    python -m benchmarks.bench --sizes 1000 100000 --output bench.json
+    python -m benchmarks.bench --compare bench.json
+
+Each phase is run ``--repeat`` times and the best wall time is kept.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import write_workbook
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+
+
+def _best(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_size(directory, rows, repeat):
+    from taxes.data import YearOperations
+    from taxes.file_handlers import _parse_b3_file
+    from taxes.file_handlers import save_output
+    from taxes.report import Report
+
+    filename = os.path.join(directory, f'negociacao-{rows}.xlsx')
+    timings = {}
+    start = time.perf_counter()
+    timings['rows'] = write_workbook(filename, rows)
+    timings['generate'] = time.perf_counter() - start
+
+    timings['parse'], b3input = _best(
+        lambda: _parse_b3_file(filename, cache=False), repeat
+    )
+    # first run fills the cache
+    _parse_b3_file(filename)
+    timings['parse_cached'], _ = _best(lambda: _parse_b3_file(filename), repeat)
+
+    ((year, stocks),) = b3input.items()
+    timings['stocks'] = len(stocks)
+    timings['year_operations'], years = _best(
+        lambda: [
+            YearOperations(stock, year, {}, operations)
+            for stock, operations in stocks.items()
+        ],
+        repeat,
+    )
+
+    def calculate():
+        for year_operations in years:
+            year_operations.calculate_loss_or_profit()
+
+    timings['calculate_loss_or_profit'], _ = _best(calculate, repeat)
+
+    report = Report({}, b3input)
+    for section in ('prepare', 'net_worth', 'profit', 'losses'):
+        timings[f'report.{section}'], _ = _best(getattr(report, section), repeat)
+
+    timings['save_output'], _ = _best(
+        lambda: save_output(report, directory=directory), repeat
+    )
+
+    return timings
+
+
+def bench_startup(repeat):
+    """Best wall time of `run.py --help`, to be kept under STARTUP_BUDGET"""
+    from taxes.cli import STARTUP_BUDGET
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, os.path.join(root, 'run.py'), '--help']
+    elapsed, _ = _best(
+        lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL),
+        max(repeat, 5),
+    )
+    return {'run.py --help': elapsed, 'budget': STARTUP_BUDGET}
+
+
+def _revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    if 'startup' in previous:
+        before = previous['startup']['run.py --help']
+        elapsed = current['startup']['run.py --help']
+        print(f'startup {before:.4f}s {elapsed:.4f}s {elapsed / before:.2f}x')
+    for size, timings in current['sizes'].items():
+        before = previous['sizes'].get(size)
+        if not before:
+            continue
+        print(f'{size} rows')
+        for phase, elapsed in timings.items():
+            if phase in ('rows', 'stocks', 'generate') or phase not in before:
+                continue
+            ratio = elapsed / before[phase] if before[phase] else float('inf')
+            print(
+                f'  {phase:<26} {before[phase]:>10.4f}s {elapsed:>10.4f}s {ratio:>6.2f}x'
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', help='previous results to compare with')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as infile:
+            previous = json.load(infile)
+
+    # timing the computation, not the handlers
+    logging.disable(logging.CRITICAL)
+
+    results = {
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'sizes': {},
+    }
+    results['startup'] = bench_startup(args.repeat)
+    print(json.dumps({'startup': results['startup']}, indent=4))
+    if results['startup']['run.py --help'] > results['startup']['budget']:
+        print('startup is over budget')
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.sizes:
+            results['sizes'][str(rows)] = bench_size(directory, rows, args.repeat)
+            print(json.dumps({rows: results['sizes'][str(rows)]}, indent=4))
+
+    with open(args.output, 'w', encoding='utf-8') as outfile:
+        json.dump(results, outfile, indent=4)
+        outfile.write('\n')
+
+    if previous:
+        compare(previous, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Synthetic B3 'Negociação' exports for the benchmarks
+
+Buys happen on odd months and sells on even months, sells never go over the
+position and stay under R$ 20.000,00 a month per stock, so the generated
+files are accepted by the current rules.
+"""
+import argparse
+import random
+from datetime import date
+
+TITLES = (
+    'Data do Negócio',
+    'Tipo de Movimentação',
+    'Mercado',
+    'Prazo/Vencimento',
+    'Instituição',
+    'Código de Negociação',
+    'Quantidade',
+    'Preço',
+    'Valor',
+)
+INSTITUTION = 'CORRETORA DE TITULOS E VALORES MOBILIARIOS S.A.'
+MONTHLY_SELL_LIMIT = 19000.0
+
+
+def tickers(count):
+    names = []
+    for number in range(count):
+        letters = ''
+        for _ in range(4):
+            number, letter = divmod(number, 26)
+            letters += chr(ord('A') + letter)
+        names.append(f'{letters}{3 + len(names) % 9}')
+    return names
+
+
+def _days(rng, year, month, spread):
+    # business days only, the export never has weekends
+    days = []
+    for day in range(1, 29):
+        current = date(year, month, day)
+        if current.weekday() < 5:
+            days.append(current)
+    return sorted(rng.sample(days, min(spread, len(days))))
+
+
+def generate_rows(rows, stocks=None, year=2023, spread=15, seed=0):
+    """Yield export rows, ``rows`` is a target and the output is close to it"""
+    rng = random.Random(seed)
+    stocks = stocks or max(10, rows // 1000)
+    trades_per_month = max(1, rows // (stocks * 12))
+    prices = {ticker: rng.uniform(5.0, 50.0) for ticker in tickers(stocks)}
+    positions = dict.fromkeys(prices, 0)
+
+    for month in range(1, 13):
+        days = _days(rng, year, month, spread)
+        for ticker, price in prices.items():
+            if month % 2:
+                trades = [
+                    ('Compra', rng.randint(1, 10)) for _ in range(trades_per_month)
+                ]
+            else:
+                budget = min(positions[ticker] // 2, int(MONTHLY_SELL_LIMIT / price))
+                each, extra = divmod(budget, trades_per_month)
+                trades = [
+                    ('Venda', each + (1 if number < extra else 0))
+                    for number in range(trades_per_month)
+                ]
+
+            for type_, quantity in trades:
+                if not quantity:
+                    continue
+                price = round(price * rng.uniform(0.99, 1.01), 2)
+                positions[ticker] += quantity if type_ == 'Compra' else -quantity
+                yield (
+                    rng.choice(days).strftime('%d/%m/%Y'),
+                    type_,
+                    'Mercado à Vista',
+                    '-',
+                    INSTITUTION,
+                    ticker,
+                    quantity,
+                    price,
+                    round(quantity * price, 2),
+                )
+            prices[ticker] = price
+
+
+def write_workbook(filename, rows, **options):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Negociação')
+    worksheet.append(TITLES)
+    count = 0
+    for row in generate_rows(rows, **options):
+        worksheet.append(row)
+        count += 1
+    workbook.save(filename)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('filename')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--stocks', type=int, help='default: one per 1000 rows')
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--spread', type=int, default=15, help='trading days a month')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    count = write_workbook(
+        args.filename,
+        args.rows,
+        stocks=args.stocks,
+        year=args.year,
+        spread=args.spread,
+        seed=args.seed,
+    )
+    print(f'{args.filename}: {count} rows')
+
+
+if __name__ == '__main__':
+    main()
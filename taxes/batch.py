@@ -0,0 +1,140 @@
+"""Report many accounts at once, in a process pool
+
+Each account has its opening positions and its exports, and its
+posicoes-finais.{year}.json are written to its own directory. Accounts are
+listed by a manifest:
+
+    {"joao": {"initial": "joao/posicoes-iniciais.json", "exports": ["joao/2023.xlsx"]}}
+
+with paths relative to the manifest, or by a directory with one subdirectory
+per account holding its exports and posicoes-iniciais.json.
+"""
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from dataclasses import dataclass
+from dataclasses import field
+from itertools import islice
+
+from taxes.file_handlers import EXPORT_EXTENSIONS
+from taxes.file_handlers import load_b3_files
+from taxes.file_handlers import load_input_file
+from taxes.file_handlers import save_output
+from taxes.report import run_years
+
+logger = logging.getLogger(__name__)
+
+INITIAL_POSITIONS = 'posicoes-iniciais.json'
+# accounts handed to the pool ahead of the free workers, per worker
+PENDING_PER_WORKER = 2
+
+
+@dataclass
+class Account:
+    name: str
+    # opening positions, none when missing
+    initial: str
+    exports: list = field(default_factory=list)
+
+
+def accounts_from_directory(directory):
+    accounts = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path):
+            continue
+        exports = [
+            os.path.join(path, filename)
+            for filename in sorted(os.listdir(path))
+            if filename.lower().endswith(EXPORT_EXTENSIONS)
+        ]
+        if not exports:
+            continue
+        initial = os.path.join(path, INITIAL_POSITIONS)
+        accounts.append(
+            Account(name, initial if os.path.exists(initial) else None, exports)
+        )
+    return accounts
+
+
+def accounts_from_manifest(filename):
+    directory = os.path.dirname(os.path.abspath(filename))
+    with open(filename, encoding='utf-8') as infile:
+        manifest = json.load(infile)
+
+    accounts = []
+    for name, details in sorted(manifest.items()):
+        initial = details.get('initial')
+        accounts.append(
+            Account(
+                name,
+                os.path.join(directory, initial) if initial else None,
+                [os.path.join(directory, export) for export in details['exports']],
+            )
+        )
+    return accounts
+
+
+def find_accounts(path):
+    if os.path.isdir(path):
+        return accounts_from_directory(path)
+    return accounts_from_manifest(path)
+
+
+def run_account(account, output, cache=True, events=None):
+    """Report every year of an account, errors are returned and not raised"""
+    result = {'account': account.name, 'years': [], 'error': None}
+    try:
+        positions = {}
+        if account.initial:
+            if not os.path.exists(account.initial):
+                raise FileNotFoundError(account.initial)
+            positions = load_input_file(account.initial)
+
+        directory = os.path.join(output, account.name)
+        os.makedirs(directory, exist_ok=True)
+        b3input = load_b3_files(account.exports, cache=cache)
+        for report in run_years(positions, b3input, events=events):
+            save_output(report, directory=directory)
+            result['years'].append(report.year)
+    # load_input_file exits on an invalid file, only this account fails
+    except (Exception, SystemExit) as error:
+        logger.exception('Failed to report %s', account.name)
+        result['error'] = f'{type(error).__name__}: {error}'
+    return result
+
+
+def run_batch(accounts, output, workers=None, cache=True, events=None):
+    """Yield the result of every account, as they finish
+
+    At most ``PENDING_PER_WORKER`` accounts per worker are submitted ahead,
+    so a long list of accounts is not queued up front.
+    """
+    workers = workers or os.cpu_count()
+    limit = workers * PENDING_PER_WORKER
+    accounts = iter(accounts)
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for account in islice(accounts, limit - len(pending)):
+                future = executor.submit(run_account, account, output, cache, events)
+                pending[future] = account
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                account = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    # the worker itself failed, like a crashed process
+                    result = {
+                        'account': account.name,
+                        'years': [],
+                        'error': f'{type(error).__name__}: {error}',
+                    }
+                yield result
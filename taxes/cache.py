@@ -0,0 +1,122 @@
+"""Cache of parsed B3 exports
+
+Parsing a workbook is the slowest part of a run, so the operations of an
+export are saved next to it, keyed by the export content and the parser
+version. The cache file is a JSON header line followed by one array per
+column, in export order.
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+from array import array
+from datetime import date
+
+from taxes.columns import BUY
+from taxes.columns import SELL
+from taxes.data import Buy
+from taxes.data import Sell
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = '.ir-acoes-cache'
+# (name, array typecode) in the order they are written
+COLUMNS = (
+    ('codes', 'I'),
+    ('dates', 'i'),
+    ('quantities', 'q'),
+    ('prices', 'd'),
+    ('sides', 'b'),
+)
+
+
+def digest(filename, version):
+    hashed = hashlib.sha256(f'{version}\n'.encode())
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            hashed.update(chunk)
+    return hashed.hexdigest()
+
+
+def cache_path(filename, version):
+    directory = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIRNAME)
+    return os.path.join(directory, f'{digest(filename, version)}.bin')
+
+
+class OperationStream:
+    """Columns of the operations of an export, all stocks mixed"""
+
+    def __init__(self):
+        self.stocks = []
+        self._index = {}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['dates'])
+
+    def append(self, operation):
+        if operation.stock not in self._index:
+            self._index[operation.stock] = len(self.stocks)
+            self.stocks.append(operation.stock)
+
+        self.columns['codes'].append(self._index[operation.stock])
+        self.columns['dates'].append(operation.date.toordinal())
+        self.columns['quantities'].append(operation.quantity)
+        self.columns['prices'].append(operation.price)
+        self.columns['sides'].append(BUY if isinstance(operation, Buy) else SELL)
+
+    def __iter__(self):
+        columns = [self.columns[name] for name, _ in COLUMNS]
+        for code, day, quantity, price, side in zip(*columns):
+            operation_type = Buy if side == BUY else Sell
+            yield operation_type(
+                self.stocks[code], quantity, price, date.fromordinal(day)
+            )
+
+    def dump(self, file):
+        header = {
+            'byteorder': sys.byteorder,
+            'stocks': self.stocks,
+            'rows': len(self),
+        }
+        file.write(json.dumps(header).encode() + b'\n')
+        for name, _ in COLUMNS:
+            self.columns[name].tofile(file)
+
+    @classmethod
+    def load(cls, file):
+        header = json.loads(file.readline())
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError('Cache written on a different architecture')
+
+        stream = cls()
+        stream.stocks = header['stocks']
+        for name, _ in COLUMNS:
+            stream.columns[name].fromfile(file, header['rows'])
+        return stream
+
+
+def load(path):
+    """Cached operations of an export, None on a cache miss"""
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as file:
+            stream = OperationStream.load(file)
+    except (ValueError, EOFError, KeyError) as error:
+        logger.warning('Ignoring cache %s: %s', path, error)
+        return None
+
+    logger.info('Using cached %s', path)
+    return stream
+
+
+def save(path, stream):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename, an interrupted run must not leave a broken cache
+    with open(f'{path}.tmp', 'wb') as file:
+        stream.dump(file)
+    os.replace(f'{path}.tmp', path)
+    logger.info('Cached %s operations as %s', len(stream), path)
@@ -0,0 +1,402 @@
+"""Command line interface
+
+Only the standard library is imported up front, every command imports what it
+needs, so --help and runs answered from the cache do not pay for openpyxl.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from taxes import metrics
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s](%(funcName)s:%(lineno)d) %(message)s'
+INITIAL_POSITIONS = 'posicoes-iniciais.json'
+COMMANDS = ('parse', 'report', 'positions', 'update', 'batch')
+# options before the command that take a value
+OPTIONS_WITH_VALUE = ('--metrics', '--profile')
+# every option of run.py itself, the others belong to the command
+OPTIONS = ('-v', '--verbose', '-q', '--quiet') + OPTIONS_WITH_VALUE
+# taxes.tradefile.EXTENSION, without importing it
+TRADE_FILE_EXTENSION = '.trades'
+# seconds for `run.py --help`, measured by the benchmarks
+STARTUP_BUDGET = 0.15
+
+
+def _load_exports(args):
+    from taxes import profiling
+    from taxes.file_handlers import load_b3_file
+    from taxes.file_handlers import load_b3_files
+
+    with metrics.timer('parse'), profiling.phase('load_b3_file'):
+        if args.store:
+            return _load_store(args)
+        if not args.exports:
+            # a single export in the project root, as it always was
+            return load_b3_file(cache=not args.no_cache)
+
+        # each file by its extension, trade files are mapped, exports parsed
+        trade_files = [
+            filename
+            for filename in args.exports
+            if filename.endswith(TRADE_FILE_EXTENSION)
+        ]
+        exports = [filename for filename in args.exports if filename not in trade_files]
+        b3input = _load_trade_files(trade_files)
+        if exports:
+            _merge(b3input, load_b3_files(exports, cache=not args.no_cache))
+        return b3input
+
+
+def _merge(b3input, other):
+    """Add the {year: {stock: operations}} of ``other`` to ``b3input``"""
+    from taxes.data import chronological
+
+    for year, stocks in other.items():
+        year_stocks = b3input.setdefault(year, {})
+        for stock, operations in stocks.items():
+            if stock in year_stocks:
+                # both sorted by date, the trade file ones go first on a day
+                operations = list(chronological(year_stocks[stock], operations))
+            year_stocks[stock] = operations
+
+
+def _load_trade_files(filenames):
+    from taxes.tradefile import open_trade_file
+
+    # mapped, not read: the operations are built as the stocks are prepared
+    b3input = {}
+    for filename in filenames:
+        trade_file = open_trade_file(filename)
+        assert trade_file.year not in b3input
+        b3input.update(trade_file.b3input())
+    return b3input
+
+
+def _load_store(args):
+    from taxes.store import Store
+
+    # the exports are added to the store, the trades are read from it
+    with Store(args.store) as store:
+        for filename in args.exports:
+            store.ingest(filename, account=args.account, cache=not args.no_cache)
+        return store.operations(account=args.account)
+
+
+def _load_events(args):
+    if not args.events:
+        return None
+    from taxes.events import load_events
+
+    return load_events(args.events)
+
+
+def _reports(args):
+    from taxes.file_handlers import load_input_file
+    from taxes.report import run_years
+
+    logger.info('Loading input files')
+    prev_stocks = load_input_file(args.initial)
+    # every export is parsed once, the years are reported in order
+    return run_years(
+        prev_stocks,
+        _load_exports(args),
+        engine=args.engine,
+        workers=args.workers,
+        cross_check=args.cross_check,
+        events=_load_events(args),
+    )
+
+
+def parse(args):
+    b3input = _load_exports(args)
+    if args.write_trades:
+        from taxes.tradefile import write_trade_file
+
+        os.makedirs(args.write_trades, exist_ok=True)
+        for year, stocks in b3input.items():
+            filename = f'negociacao.{year}{TRADE_FILE_EXTENSION}'
+            write_trade_file(os.path.join(args.write_trades, filename), {year: stocks})
+
+    summary = {}
+    for year, stocks in sorted(b3input.items()):
+        summary[year] = {
+            stock: len(operations) for stock, operations in sorted(stocks.items())
+        }
+    json.dump(summary, sys.stdout, indent=4)
+    sys.stdout.write('\n')
+
+
+def _write_report(year_report):
+    from taxes import profiling
+    from taxes.file_handlers import save_output
+
+    # prints 'Bens e Direitos'
+    year_report.net_worth()
+    # prints 'Rendimentos isentos e não tributáveis'
+    year_report.profit()
+    # prints 'Renda Variável - Ganhos Líquidos ou perdas em operações
+    # comuns/day-trade...'
+    year_report.losses()
+
+    with metrics.timer('save_output'), profiling.phase('save_output'):
+        save_output(year_report)
+
+
+def _pipeline(args):
+    from taxes.file_handlers import load_input_file
+    from taxes.pipeline import run
+
+    if not args.exports:
+        logger.error('--pipeline needs the exports, in chronological order')
+        return 1
+    # nothing to overlap, trade files are mapped and the store is queried
+    if args.store:
+        logger.error('--pipeline does not work with --store')
+        return 1
+    if any(filename.endswith(TRADE_FILE_EXTENSION) for filename in args.exports):
+        logger.error('--pipeline parses exports, not %s files', TRADE_FILE_EXTENSION)
+        return 1
+    run(
+        load_input_file(args.initial),
+        args.exports,
+        write=_write_report,
+        workers=args.workers,
+        cache=not args.no_cache,
+        engine=args.engine,
+        cross_check=args.cross_check,
+        events=_load_events(args),
+    )
+    return 0
+
+
+def report(args):
+    if args.pipeline:
+        return _pipeline(args)
+
+    for year_report in _reports(args):
+        _write_report(year_report)
+        if args.store:
+            from taxes.store import Store
+
+            with Store(args.store) as store:
+                store.save_results(year_report, account=args.account)
+
+
+def positions(args):
+    content = {}
+    for year_report in _reports(args):
+        content[year_report.year] = year_report.positions()
+    json.dump(content, sys.stdout, sort_keys=True, indent=4, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+def update(args):
+    from taxes.file_handlers import load_input_file
+    from taxes.incremental import run_years
+
+    prev_stocks = load_input_file(args.initial)
+    year_reports = run_years(
+        prev_stocks, _load_exports(args), args.state_dir, events=_load_events(args)
+    )
+    for year_report in year_reports:
+        _write_report(year_report)
+
+
+def batch(args):
+    from taxes.batch import find_accounts
+    from taxes.batch import run_batch
+
+    results = run_batch(
+        find_accounts(args.accounts),
+        args.output,
+        workers=args.workers,
+        cache=not args.no_cache,
+        events=_load_events(args),
+    )
+    results = sorted(results, key=lambda result: result['account'])
+    json.dump(results, sys.stdout, indent=4, ensure_ascii=False)
+    sys.stdout.write('\n')
+    # accounts are independent, but the run failed if any of them did
+    return 1 if any(result['error'] for result in results) else 0
+
+
+def _write_metrics(filename):
+    if filename == '-':
+        json.dump(metrics.summary(), sys.stderr, indent=4)
+        sys.stderr.write('\n')
+        return
+
+    with open(filename, 'w', encoding='utf-8') as outfile:
+        json.dump(metrics.summary(), outfile, indent=4)
+        outfile.write('\n')
+
+
+def _write_profile(directory):
+    from taxes import profiling
+
+    profiling.disable()
+    profiling.save(directory)
+    for line in profiling.table():
+        sys.stderr.write(line + '\n')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='run.py', description='Calculadora de imposto de renda (ações)'
+    )
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        '-v', '--verbose', action='store_true', help='log every parsed row'
+    )
+    verbosity.add_argument(
+        '-q', '--quiet', action='store_true', help='only log warnings and errors'
+    )
+    parser.add_argument(
+        '--metrics',
+        metavar='FILE',
+        help='write counters and timings as JSON to FILE, - for stderr',
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='DIRECTORY',
+        help='profile each phase, print its time and peak memory and save '
+        'the .pstats and folded stacks to DIRECTORY',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    commands = (
+        (parse, 'parse the exports and show the operations of each stock'),
+        (report, 'print the report and save posicoes-finais.{year}.json'),
+        (positions, 'print the year end positions as JSON'),
+        (update, 'apply only the new trades to the state saved by the last update'),
+    )
+    for command, help_ in commands:
+        subparser = subparsers.add_parser(command.__name__, help=help_)
+        subparser.set_defaults(command=command)
+        subparser.add_argument(
+            'exports',
+            nargs='*',
+            help='B3 exports (.xlsx or .csv), default: the one in the project root',
+        )
+        subparser.add_argument(
+            '--no-cache', action='store_true', help='always parse the exports'
+        )
+        subparser.add_argument(
+            '--store',
+            metavar='FILE',
+            help='SQLite store the exports are added to and the trades read from',
+        )
+        subparser.add_argument(
+            '--account', default='default', help='account in the store'
+        )
+        if command is parse:
+            subparser.add_argument(
+                '--write-trades',
+                metavar='DIRECTORY',
+                help='save negociacao.{year}.trades, a mapped file any command '
+                'reads in place of the exports',
+            )
+            continue
+        subparser.add_argument('--initial', default=INITIAL_POSITIONS)
+        subparser.add_argument(
+            '--events',
+            metavar='FILE',
+            help='JSON with splits, reverse splits and bonus shares',
+        )
+        if command is update:
+            subparser.add_argument(
+                '--state-dir',
+                default='.',
+                help='where estado.{year}.json is kept, default: current directory',
+            )
+            continue
+        subparser.add_argument(
+            '--engine', choices=('python', 'numpy', 'fixed'), default='python'
+        )
+        subparser.add_argument(
+            '--workers', type=int, help='prepare the stocks in a process pool'
+        )
+        if command is report:
+            subparser.add_argument(
+                '--pipeline',
+                action='store_true',
+                help='parse the exports in a process pool while the years '
+                'already parsed are reported',
+            )
+        subparser.add_argument(
+            '--cross-check',
+            action='store_true',
+            help='warn where the results differ from the fixed point engine',
+        )
+
+    subparser = subparsers.add_parser(
+        'batch', help='report many accounts, each to its own directory'
+    )
+    subparser.set_defaults(command=batch)
+    subparser.add_argument(
+        'accounts',
+        help='JSON manifest of the accounts, or a directory with one per account',
+    )
+    subparser.add_argument(
+        '--output', default='.', help='where a directory per account is written'
+    )
+    subparser.add_argument(
+        '--workers', type=int, help='processes, default: one per CPU'
+    )
+    subparser.add_argument(
+        '--no-cache', action='store_true', help='always parse the exports'
+    )
+    subparser.add_argument(
+        '--events',
+        metavar='FILE',
+        help='JSON with splits, reverse splits and bonus shares of every account',
+    )
+
+    return parser
+
+
+def _with_command(argv):
+    # `run.py` and `run.py export.xlsx ...` still print the report
+    argv = list(argv)
+    if {'-h', '--help'} & set(argv):
+        return argv
+
+    index = 0
+    while index < len(argv):
+        option = argv[index].split('=', 1)[0]
+        if option not in OPTIONS:
+            break
+        # skip the value of the options taking one
+        index += 2 if argv[index] in OPTIONS_WITH_VALUE else 1
+    # the command goes before the first option run.py does not know
+    if index >= len(argv) or argv[index] not in COMMANDS:
+        argv.insert(min(index, len(argv)), 'report')
+    return argv
+
+
+def main(argv=None):
+    argv = _with_command(sys.argv[1:] if argv is None else argv)
+    args = build_parser().parse_args(argv)
+    level = logging.INFO
+    if args.verbose:
+        level = logging.DEBUG
+    elif args.quiet:
+        level = logging.WARNING
+    logging.basicConfig(format=LOG_FORMAT, level=level)
+
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        from taxes import profiling
+
+        profiling.enable()
+    status = args.command(args)
+    if args.metrics:
+        _write_metrics(args.metrics)
+    if args.profile:
+        _write_profile(args.profile)
+    return status or 0
@@ -0,0 +1,73 @@
+from array import array
+from datetime import date
+
+from taxes.data import Buy
+from taxes.data import Sell
+
+BUY = 1
+SELL = -1
+
+
+class OperationColumns:
+    """Array backed storage for the operations of a single stock
+
+    Each operation takes 29 bytes instead of a Python object per trade.
+    Operations are rebuilt on access, so it can be used wherever a list of
+    operations is expected, and YearOperations.extend_rows() applies the
+    columns without building them.
+    """
+
+    __slots__ = ('stock', 'dates', 'quantities', 'prices', 'totals', 'sides')
+
+    def __init__(self, stock, operations=()):
+        self.stock = stock
+        # date ordinals
+        self.dates = array('i')
+        self.quantities = array('q')
+        self.prices = array('d')
+        # as Operation.total
+        self.totals = array('d')
+        self.sides = array('b')
+        self.extend(operations)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        side = self.sides[index]
+        operation_type = Buy if side == BUY else Sell
+        return operation_type(
+            self.stock,
+            self.quantities[index],
+            self.prices[index],
+            date.fromordinal(self.dates[index]),
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def append(self, operation):
+        assert operation.stock == self.stock
+        if isinstance(operation, Buy):
+            side = BUY
+        elif isinstance(operation, Sell):
+            side = SELL
+        else:
+            raise TypeError('Only buy or sell allowed')
+
+        self.append_row(
+            operation.date.toordinal(), operation.quantity, operation.price, side
+        )
+
+    def append_row(self, ordinal, quantity, price, side):
+        """Append a trade without building it, ``side`` is BUY or SELL"""
+        self.dates.append(ordinal)
+        self.quantities.append(quantity)
+        self.prices.append(price)
+        self.totals.append(round(price * quantity, 6))
+        self.sides.append(side)
+
+    def extend(self, operations):
+        for operation in operations:
+            self.append(operation)
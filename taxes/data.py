@@ -1,34 +1,166 @@
+import heapq
 import logging
+from bisect import bisect_right
 from calendar import month_name
 from dataclasses import dataclass
+from dataclasses import field
+from datetime import date
 from datetime import datetime
+from operator import attrgetter
+
+from taxes.events import Event
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Operation:
     stock: str
     quantity: int
     price: float
     date: datetime.date
+    # computed once, operations are immutable
+    total: float = field(init=False, repr=False, compare=False)
 
-    @property
-    def total(self):
-        return round(self.price * self.quantity, 6)
+    def __post_init__(self):
+        object.__setattr__(self, 'total', round(self.price * self.quantity, 6))
 
 
 class Buy(Operation):
     """Buy op"""
 
+    __slots__ = ()
+
 
 class Sell(Operation):
     """Sell op"""
 
+    __slots__ = ()
+
+
+@dataclass(frozen=True, slots=True)
+class DayTrade:
+    """Quantity bought and sold of a stock on the same day"""
+
+    stock: str
+    date: datetime.date
+    quantity: int
+    # average prices of the day, on each side
+    buy_price: float
+    sell_price: float
+
+    @property
+    def result(self):
+        return self.quantity * self.sell_price - self.quantity * self.buy_price
+
+
+class DayTradeIndex:
+    """Buys and sells of every (stock, date), built in a single pass
+
+    The matched quantity of a day is a day trade, taxed on its own. What is
+    left of that day goes to the common operations, at the day average price.
+    """
+
+    def __init__(self, operations=()):
+        # (stock, date) -> [buy quantity, buy total, sell quantity, sell total]
+        self._days = {}
+        for operation in operations:
+            self.add(operation)
+
+    def add(self, operation):
+        if not isinstance(operation, (Buy, Sell)):
+            raise TypeError('Only buy or sell allowed')
+        self.add_row(
+            operation.stock,
+            operation.date,
+            operation.quantity,
+            operation.total,
+            isinstance(operation, Buy),
+        )
+
+    def add_row(self, stock, date_, quantity, total, buy):
+        """Add a trade read from columns, ``total`` as Operation.total"""
+        day = self._days.get((stock, date_))
+        if day is None:
+            day = self._days[(stock, date_)] = [0, 0.0, 0, 0.0]
+
+        if buy:
+            day[0] += quantity
+            day[1] += total
+        else:
+            day[2] += quantity
+            day[3] += total
+
+    def is_day_trade(self, stock, date_):
+        day = self._days.get((stock, date_))
+        return day is not None and day[0] > 0 and day[2] > 0
+
+    def day_trade(self, stock, date_):
+        if not self.is_day_trade(stock, date_):
+            return None
+
+        buy_quantity, buy_total, sell_quantity, sell_total = self._days[(stock, date_)]
+        return DayTrade(
+            stock,
+            date_,
+            min(buy_quantity, sell_quantity),
+            buy_total / buy_quantity,
+            sell_total / sell_quantity,
+        )
+
+    def _remainder(self, trade):
+        buy_quantity, _, sell_quantity, _ = self._days[(trade.stock, trade.date)]
+        if buy_quantity > sell_quantity:
+            return Buy(
+                trade.stock, buy_quantity - trade.quantity, trade.buy_price, trade.date
+            )
+        if sell_quantity > buy_quantity:
+            return Sell(
+                trade.stock,
+                sell_quantity - trade.quantity,
+                trade.sell_price,
+                trade.date,
+            )
+        return None
+
+    def split_day(self, stock, date_):
+        """Day trade of a day with day trades and its remainder, or None"""
+        trade = self.day_trade(stock, date_)
+        return trade, self._remainder(trade)
+
+    def split(self, operations):
+        """Common operations and day trades, in the order of ``operations``
+
+        The operations of a day with day trades are replaced by the day
+        remainder, if any, where the first of them was.
+        """
+        common = []
+        day_trades = []
+        seen = set()
+        for operation in operations:
+            if not self.is_day_trade(operation.stock, operation.date):
+                common.append(operation)
+                continue
+
+            key = (operation.stock, operation.date)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            trade, remainder = self.split_day(operation.stock, operation.date)
+            day_trades.append(trade)
+            if remainder:
+                common.append(remainder)
+
+        return common, day_trades
+
 
 class MonthlyBucket:
     def __init__(self):
         self.ops = []
+        # running sums, kept up to date by add()
+        self._total = 0.0
+        self._quantity = 0
 
     def __len__(self):
         return len(self.ops)
@@ -38,20 +170,32 @@ class MonthlyBucket:
             assert isinstance(op, type(self.ops[0]))
 
         self.ops.append(op)
+        self.add_row(op.quantity, op.total)
+
+    def add_row(self, quantity, total):
+        """Add a trade read from columns, it is summed but not kept"""
+        self._total += total
+        self._quantity += quantity
 
     @property
     def total(self):
-        sum_ = 0.0
-        for op in self.ops:
-            sum_ += op.total
-        return sum_
+        return self._total
 
     @property
     def quantity(self):
-        sum_ = 0
-        for op in self.ops:
-            sum_ += op.quantity
-        return sum_
+        return self._quantity
+
+    def state(self):
+        return [self._total, self._quantity]
+
+    @classmethod
+    def from_state(cls, state):
+        """Bucket with the sums of a saved one, without its operations"""
+        bucket = cls()
+        total, quantity = state
+        bucket._total = total
+        bucket._quantity = quantity
+        return bucket
 
 
 class MonthOperations:
@@ -75,12 +219,189 @@ class MonthOperations:
             raise TypeError('Only buy or sell allowed')
 
 
+def chronological(*streams):
+    """Merge operation streams that are each sorted by date
+
+    Operations on the same date keep the order of their streams.
+    """
+    return heapq.merge(*streams, key=attrgetter('date'))
+
+
+class Ledger:
+    """Average cost of a stock, applied one trade at a time in date order
+
+    The position is snapshotted at the end of every month: index ``n`` holds
+    the position after the first ``n`` months, so index 0 is the previous year
+    position and index 12 is the year end position. ``costs`` has the average
+    cost of the shares sold in each month.
+    """
+
+    def __init__(self, previous_total, previous_quantity, operations=(), close=True):
+        self.buy_total = [previous_total]
+        self.sell_total = [0.0]
+        self.buy_quantity = [previous_quantity]
+        self.sell_quantity = [0]
+        self.quantity = [previous_quantity]
+        self.average = []
+        self.costs = [0.0] * 12
+
+        self._total = previous_total
+        self._quantity = previous_quantity
+        # consecutive buys and sells are applied as a single trade, which is the
+        # same as applying a month at once when buys and sells do not mix
+        self._bought_total = 0.0
+        self._bought_quantity = 0
+        self._sold = 0
+        # average of the pending sells, recomputed after a buy or a new month
+        self._average = None
+        self._snapshot_average()
+
+        self._month = 1
+        self._reset_month()
+        self.extend(operations)
+        if close:
+            self.close()
+
+    def extend(self, operations):
+        """Apply operations sorted by date, after the ones already applied"""
+        for operation in operations:
+            while operation.date.month > self._month:
+                self._snapshot()
+            self.apply(operation)
+
+    def close(self):
+        """Snapshot the months left, up to the year end"""
+        while self._month <= 12:
+            self._snapshot()
+
+    def state(self):
+        """Everything needed to go on applying trades, serializable as JSON"""
+        return {
+            name: list(value) if isinstance(value, list) else value
+            for name, value in vars(self).items()
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        ledger = cls.__new__(cls)
+        for name, value in state.items():
+            setattr(ledger, name, list(value) if isinstance(value, list) else value)
+        return ledger
+
+    def _reset_month(self):
+        self._month_buy_total = 0.0
+        self._month_sell_total = 0.0
+        self._month_buy_quantity = 0
+        self._month_sell_quantity = 0
+
+    def _flush_sells(self):
+        if self._sold:
+            self.costs[self._month - 1] += self._average * self._sold
+            self._sold = 0
+        self._average = None
+
+    def _flush_buys(self):
+        if self._bought_quantity:
+            self._total += self._bought_total
+            self._quantity += self._bought_quantity
+            self._bought_total = 0.0
+            self._bought_quantity = 0
+            self._average = None
+
+    def _snapshot_average(self):
+        if not self._quantity:
+            self._total = 0.0
+            self.average.append(0.0)
+        else:
+            self.average.append(self._total / self._quantity)
+
+    def _snapshot(self):
+        self._flush_sells()
+        self._flush_buys()
+        self.buy_total.append(self.buy_total[-1] + self._month_buy_total)
+        self.sell_total.append(self.sell_total[-1] + self._month_sell_total)
+        self.buy_quantity.append(self.buy_quantity[-1] + self._month_buy_quantity)
+        self.sell_quantity.append(self.sell_quantity[-1] + self._month_sell_quantity)
+        self.quantity.append(self._quantity)
+        self._snapshot_average()
+        self._reset_month()
+        self._month += 1
+
+    def extend_rows(self, rows, events=()):
+        """Apply the trades of an OperationColumns, without an object per row
+
+        ``events`` are the ones up to the last row, each goes before the
+        trades of its date.
+        """
+        # taxes.columns imports this module
+        from taxes.columns import BUY
+
+        pending = 0
+        ordinal = None
+        for day, quantity, total, side in zip(
+            rows.dates, rows.quantities, rows.totals, rows.sides
+        ):
+            if day != ordinal:
+                ordinal = day
+                date_ = date.fromordinal(day)
+                while pending < len(events) and events[pending].date <= date_:
+                    self.extend([events[pending]])
+                    pending += 1
+                while date_.month > self._month:
+                    self._snapshot()
+            if side == BUY:
+                self._buy(quantity, total)
+            else:
+                self._sell(quantity, total)
+        self.extend(events[pending:])
+
+    def _buy(self, quantity, total):
+        self._flush_sells()
+        self._bought_total += total
+        self._bought_quantity += quantity
+        self._month_buy_total += total
+        self._month_buy_quantity += quantity
+
+    def _sell(self, quantity, total):
+        # selling does not change the average, only buying does
+        self._flush_buys()
+        if self._average is None:
+            self._average = self._total / self._quantity
+        self._quantity -= quantity
+        self._total = self._quantity * self._average
+        self._sold += quantity
+        self._month_sell_total += total
+        self._month_sell_quantity += quantity
+
+    def apply(self, operation):
+        if isinstance(operation, Buy):
+            self._buy(operation.quantity, operation.total)
+        elif isinstance(operation, Sell):
+            self._sell(operation.quantity, operation.total)
+        elif isinstance(operation, Event):
+            self._flush_sells()
+            self._flush_buys()
+            self._quantity, self._total = operation.adjust(self._quantity, self._total)
+        else:
+            raise TypeError('Only buy, sell or events allowed')
+
+
 class YearOperations:
-    def __init__(self, stock, year, previous_year, operations):
+    def __init__(
+        self,
+        stock,
+        year,
+        previous_year,
+        operations,
+        state=None,
+        close=True,
+        events=(),
+    ):
         self.stock = stock
         self.year = year
         self.accum_loss = 0.0
-        self.tax_free_profit = 0.0
+        # sum of the profitable months, exempt or not is decided by assess()
+        self.profit = 0.0
         self.operation_results = [0.0] * 12
         self.months = [MonthOperations(month=i) for i in range(1, 13)]
 
@@ -90,97 +411,173 @@ class YearOperations:
             self.previous_total = previous_year['total']
             self.previous_quantity = previous_year['quantidade']
 
+        # common operations in date order, what the ledger was built from
+        self.operations = []
+        self.day_trades = []
+        self.day_trade_results = [0.0] * 12
+        # corporate events of the year, in date order
+        self.events = list(events)
+        self._applied_events = 0
+        # from a state only the operations applied after it are kept
+        self.restored = state is not None
+        if state is None:
+            self.ledger = Ledger(
+                self.previous_total, self.previous_quantity, close=False
+            )
+        else:
+            self._restore(state)
+
+        # trades are applied one at a time, so buys and sells can share a month
+        self.extend(sorted(operations, key=attrgetter('date')))
+        if close:
+            self.close()
+
+    def extend(self, operations):
+        """Apply operations sorted by date, with all the operations of their days
+
+        Only before close(), ``operations`` go after the ones already applied.
+        """
+        # buys and sells on the same day are day trades, with their own results
+        operations, day_trades = DayTradeIndex(operations).split(operations)
+        self.day_trades.extend(day_trades)
+        for trade in day_trades:
+            self.day_trade_results[trade.date.month - 1] += trade.result
         for operation in operations:
             index_month = operation.date.month - 1
             self.months[index_month].add(operation)
 
-        # validate there is buy/sell at the same month
-        # this is a TODO for this script (issue #1)
-        for month in self.months:
-            assert not (month.buy.quantity and month.sell.quantity)
+        self.operations.extend(operations)
+        if operations:
+            events = self._pending_events(operations[-1].date)
+            self.ledger.extend(chronological(events, operations))
+
+    def extend_rows(self, rows, day_trades=()):
+        """Apply an OperationColumns, with the day trades already taken out
+
+        The same as extend() with the operations of ``rows``, for a year
+        with nothing applied yet, without building them.
+        """
+        from taxes.columns import BUY
+
+        assert not self.operations and not self.day_trades
+        self.day_trades.extend(day_trades)
+        for trade in day_trades:
+            self.day_trade_results[trade.date.month - 1] += trade.result
+        ordinal = None
+        for day, quantity, total, side in zip(
+            rows.dates, rows.quantities, rows.totals, rows.sides
+        ):
+            if day != ordinal:
+                ordinal = day
+                month = self.months[date.fromordinal(day).month - 1]
+            (month.buy if side == BUY else month.sell).add_row(quantity, total)
+
+        # built one at a time only if read, by the fixed point ledger
+        self.operations = rows
+        if rows:
+            events = self._pending_events(date.fromordinal(rows.dates[-1]))
+            self.ledger.extend_rows(rows, events)
+
+    def _pending_events(self, last_date=None):
+        # events up to last_date not applied yet, they go before the trades
+        # of their day
+        start = self._applied_events
+        if last_date is None:
+            end = len(self.events)
+        else:
+            end = bisect_right(self.events, last_date, key=attrgetter('date'))
+        self._applied_events = max(start, end)
+        return self.events[start:end]
+
+    def close(self):
+        self.ledger.extend(self._pending_events())
+        self.ledger.close()
+
+    def state(self):
+        """Checkpoint of a year not closed yet, see taxes.incremental
+
+        Operations and day trades are not kept, only their sums.
+        """
+        return {
+            'months': [
+                [month.buy.state(), month.sell.state()] for month in self.months
+            ],
+            'day_trade_results': list(self.day_trade_results),
+            'ledger': self.ledger.state(),
+            'events': self._applied_events,
+        }
+
+    def _restore(self, state):
+        for month, (buy, sell) in zip(self.months, state['months']):
+            month.buy = MonthlyBucket.from_state(buy)
+            month.sell = MonthlyBucket.from_state(sell)
+        self.day_trade_results = list(state['day_trade_results'])
+        self.ledger = Ledger.from_state(state['ledger'])
+        self._applied_events = state['events']
 
     def calculate_loss_or_profit(self):
         for month_number, month in enumerate(self.months):
             if not month.sell.quantity:
                 continue
-            # this will start with zero, which is the correct first month (previous)
-            buy_price = (
-                self.accumulated_average(month=month_number) * month.sell.quantity
-            )
+            # average cost of each sold share when it was sold
+            buy_price = self.ledger.costs[month_number]
 
             result = month.sell.total - buy_price
-            assert month.sell.total < 20000.00  # TODO issue #2
-            logger.info(
-                'On %s sell quantity %s remains %s, buy price %s sold total %s diff %s',
-                month_name[month_number + 1],
-                month.sell.quantity,
-                self.accumulated_quantity(month=month_number + 1),
-                round(buy_price, 5),
-                round(month.sell.total, 5),
-                round(result, 5),
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    'On %s sell quantity %s remains %s, buy price %s sold total %s '
+                    'diff %s',
+                    month_name[month_number + 1],
+                    month.sell.quantity,
+                    self.accumulated_quantity(month=month_number + 1),
+                    round(buy_price, 5),
+                    round(month.sell.total, 5),
+                    round(result, 5),
+                )
             if result < 0.0:
                 month.loss = result
                 self.accum_loss += result
             else:
                 month.profit = result
-                self.tax_free_profit += result
+                self.profit += result
 
             self.operation_results[month_number] = result
 
-        logger.info(
-            'Tax free profit: %s, loss: %s', self.tax_free_profit, self.accum_loss
-        )
+        logger.info('Profit: %s, loss: %s', self.profit, self.accum_loss)
+
+    def position(self):
+        """Year end position, as saved in posicoes-finais.{year}.json"""
+        if not self.accumulated_quantity():
+            return None
+
+        return {
+            'total': round(self.accumulated_quantity() * self.accumulated_average(), 2),
+            'preco-medio': round(self.accumulated_average(), 9),
+            'quantidade': self.accumulated_quantity(),
+        }
 
     def accumulated_total(self, operation_type, month=12):
-        sum_ = self.previous_total if operation_type == 'BUY' else 0.0
-        for month in self.months[:month]:
-            sum_ += month.buy.total if operation_type == 'BUY' else month.sell.total
-        return sum_
+        if operation_type == 'BUY':
+            return self.ledger.buy_total[month]
+        return self.ledger.sell_total[month]
 
     def accumulated_quantity(self, operation_type='', month=12):
-        sum_ = self.previous_quantity if operation_type in ('BUY', '') else 0
-        for month in self.months[:month]:
-            if operation_type == 'BUY':
-                sum_ += month.buy.quantity
-            elif operation_type == 'SELL':
-                sum_ += month.sell.quantity
-
-            if not operation_type:
-                sum_ += month.buy.quantity - month.sell.quantity
-        return sum_
+        if not operation_type:
+            return self.ledger.quantity[month]
+        if operation_type == 'BUY':
+            return self.ledger.buy_quantity[month]
+        if operation_type == 'SELL':
+            return self.ledger.sell_quantity[month]
+        return 0
 
     def accumulated_average(self, operation_type='', month=12):
-        average = 0.0
         if operation_type in ('BUY', 'SELL'):
             quantity = self.accumulated_quantity(
                 operation_type=operation_type, month=month
             )
             if not quantity:
-                return average
+                return 0.0
 
             return self.accumulated_total(operation_type, month=month) / quantity
 
-        result = 0.0
-        accum_total = self.previous_total
-        accum_quantity = self.previous_quantity
-        for month in self.months[:month]:
-            # issue #1 needs to account for buy & sell in the same month
-            if month.buy.quantity:
-                accum_total += month.buy.total
-                accum_quantity += month.buy.quantity
-
-            # issue #1 as well
-            if month.sell.quantity:
-                average = accum_total / accum_quantity
-                accum_quantity -= month.sell.quantity
-                accum_total = accum_quantity * average
-
-            if not accum_quantity:
-                accum_total = 0.0
-                result = 0.0
-
-        if not accum_quantity:
-            return result
-
-        return accum_total / accum_quantity
+        return self.ledger.average[month]
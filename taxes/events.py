@@ -0,0 +1,104 @@
+"""Corporate events that change a position without trades
+
+Splits (desdobramentos), reverse splits (grupamentos) and bonus shares
+(bonificações) are read from a JSON file, like:
+
+    {"ABCD3": [{"data": "2023-04-25", "tipo": "desdobramento", "fator": "2"}]}
+
+``fator`` is the number of new shares for each share held, "1/10" for a
+10 to 1 reverse split or "0.1" for one bonus share for every ten. Bonus
+shares have the cost per share set by the company in ``custo``. Events take
+effect on their ex date, before the trades of that day.
+"""
+import json
+import logging
+import math
+from bisect import bisect_left
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date
+from fractions import Fraction
+
+logger = logging.getLogger(__name__)
+
+SPLIT = 'desdobramento'
+REVERSE_SPLIT = 'grupamento'
+BONUS = 'bonificacao'
+KINDS = (SPLIT, REVERSE_SPLIT, BONUS)
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    stock: str
+    date: date
+    kind: str
+    factor: Fraction
+    # cost of each bonus share
+    cost: float = 0.0
+
+    def __post_init__(self):
+        assert self.kind in KINDS
+        assert self.factor > 0
+        assert self.kind == BONUS or not self.cost
+
+    def quantity(self, quantity):
+        """Shares held after the event
+
+        Fractions left by a reverse split or a bonus are sold by the company,
+        their cost stays with the position.
+        """
+        if self.kind == BONUS:
+            return quantity + math.floor(quantity * self.factor)
+        return math.floor(quantity * self.factor)
+
+    def adjust(self, quantity, total):
+        """Quantity and total cost after the event, the average follows"""
+        adjusted = self.quantity(quantity)
+        if self.kind == BONUS:
+            total += (adjusted - quantity) * self.cost
+        return adjusted, total
+
+
+class EventIndex:
+    """Events of every stock, sorted by date"""
+
+    def __init__(self, events=()):
+        self._events = {}
+        for event in events:
+            self._events.setdefault(event.stock, []).append(event)
+        self._dates = {}
+        for stock, stock_events in self._events.items():
+            stock_events.sort(key=lambda event: event.date)
+            self._dates[stock] = [event.date for event in stock_events]
+
+    def __len__(self):
+        return sum(len(stock_events) for stock_events in self._events.values())
+
+    def for_stock(self, stock, year):
+        """Events of a stock in a year, in date order"""
+        dates = self._dates.get(stock)
+        if not dates:
+            return []
+        start = bisect_left(dates, date(year, 1, 1))
+        end = bisect_right(dates, date(year, 12, 31))
+        return self._events[stock][start:end]
+
+
+def load_events(filename):
+    with open(filename, encoding='utf-8') as infile:
+        content = json.load(infile)
+
+    events = []
+    for stock, stock_events in content.items():
+        for details in stock_events:
+            events.append(
+                Event(
+                    stock,
+                    date.fromisoformat(details['data']),
+                    details['tipo'],
+                    Fraction(str(details['fator'])),
+                    float(details.get('custo', 0.0)),
+                )
+            )
+    logger.info('Loaded %s events from %s', len(events), filename)
+    return EventIndex(events)
@@ -1,16 +1,24 @@
+import csv
 import logging
 import os
 import sys
 import json
+from datetime import date
 from datetime import datetime
 from enum import IntEnum
-from openpyxl import load_workbook
+from operator import attrgetter
+from taxes import cache as b3cache
+from taxes import metrics
+from taxes import profiling
+from taxes.columns import OperationColumns
 from taxes.data import Buy
 from taxes.data import Sell
+from taxes.data import chronological
 
 logger = logging.getLogger(__name__)
 
 
+@profiling.profiled('load_input_file')
 def load_input_file(filename):
     if not os.path.exists(filename):
         logger.error('Missing %s', filename)
@@ -34,6 +42,10 @@ def load_input_file(filename):
     return stocks
 
 
+# bump when the parsed operations change, it invalidates the cache
+PARSER_VERSION = 1
+
+
 class col(IntEnum):
     date = 0
     type_ = 1
@@ -43,99 +55,244 @@ class col(IntEnum):
     total = 8
 
 
-def _parse_b3_file(filename):
-    logger.info('parsing %s', filename)
-    workbook = load_workbook(filename)
+EXPORT_EXTENSIONS = ('.xlsx', '.csv')
 
-    worksheet = workbook['Negociação']
-    rows = iter(worksheet.rows)
-    titles = [title.value for title in next(rows)]
-    logger.info('Loading -> %s', ', '.join(titles))
 
-    assert 'Data do Negócio' == titles[col.date]
-    assert 'Tipo de Movimentação' == titles[col.type_]
-    assert 'Código de Negociação' == titles[col.code]
-    assert 'Quantidade' == titles[col.quantity]
-    assert 'Preço' == titles[col.price]
+def _xlsx_rows(filename):
+    # openpyxl takes a while to import, cached runs do not need it
+    from openpyxl import load_workbook
 
-    year = 0
-    stocks = {}
-    for row in rows:
-        row = [cell.value for cell in row]
-        logger.debug(row)
+    workbook = load_workbook(filename, read_only=True, data_only=True)
+    try:
+        yield from workbook['Negociação'].iter_rows(values_only=True)
+    finally:
+        workbook.close()
 
-        op_type = row[col.type_].upper()
-        assert op_type in ('VENDA', 'COMPRA')
 
-        date = row[col.date]
-        if isinstance(date, str):
-            date = datetime.strptime(row[col.date], '%d/%m/%Y').date()
-        else:
-            date = date.date()
-        # validate there is a single year in the Excel sheet
-        if not year:
-            year = date.year
-        assert year == date.year
+def _to_number(value):
+    """Numbers as B3 writes them in CSV, like 1.234,56 or R$ 10,50"""
+    value = value.replace('R$', '').strip()
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    return float(value)
 
-        quantity = row[col.quantity]
-        assert isinstance(quantity, int)
-        price = float(row[col.price])
-        code = row[col.code]
 
-        if op_type == 'COMPRA':
-            operation = Buy(code, quantity, price, date)
-        else:
-            operation = Sell(code, quantity, price, date)
+def _csv_rows(filename):
+    with open(filename, newline='', encoding='utf-8-sig') as file:
+        delimiter = ';' if ';' in file.readline() else ','
+        file.seek(0)
+        reader = csv.reader(file, delimiter=delimiter)
+        yield next(reader)
+        for row in reader:
+            if not row or not row[col.date]:
+                continue
+            row[col.quantity] = int(row[col.quantity].replace('.', ''))
+            row[col.price] = _to_number(row[col.price])
+            row[col.total] = _to_number(row[col.total])
+            yield row
+
+
+def _date_decoder():
+    """Decode the date cells, each distinct value is parsed once
+
+    Exports repeat the same few hundred dates, the dd/mm/yyyy strings are
+    sliced instead of going through strptime.
+    """
+    decoded = {}
 
+    def decode(value):
         try:
-            assert round(operation.total, 2) == round(row[col.total], 2)
-        except AssertionError:
-            logger.warning("No match between %s and %s ", round(operation.total, 2), round(row[col.total], 2))
-            if abs(round(operation.total, 2) - round(row[col.total], 2)) > 1.0:
-                raise
-        if operation.stock not in stocks:
-            stocks[operation.stock] = [operation]
+            return decoded[value]
+        except KeyError:
+            pass
+        if not isinstance(value, str):
+            result = value.date()
+        elif len(value) == 10 and value[2] == value[5] == '/':
+            result = date(int(value[6:]), int(value[3:5]), int(value[:2]))
         else:
-            stocks[operation.stock].append(operation)
+            result = datetime.strptime(value, '%d/%m/%Y').date()
+        decoded[value] = result
+        return result
+
+    return decode
+
+
+# exports are trusted up to this difference in the total of a row
+TOTAL_TOLERANCE = 1.0
+
+
+def _check_totals(filename, mismatches):
+    """Report every row whose total does not match its quantity and price"""
+    if not mismatches:
+        return
+    for line, total, exported in mismatches:
+        logger.warning('No match between %s and %s on row %s', total, exported, line)
+    failed = [
+        f'row {line}: {total} != {exported}'
+        for line, total, exported in mismatches
+        if abs(total - exported) > TOTAL_TOLERANCE
+    ]
+    assert not failed, f'Invalid totals in {filename}: ' + ', '.join(failed)
+
+
+def _iter_b3_file(filename):
+    """Yield the operations from a B3 export one row at a time
+
+    Both the Excel and the CSV exports are read as a stream, picked by the file
+    extension. Rows whose total is off are reported together once the export
+    is read, the error comes after the last operation.
+    """
+    logger.info('parsing %s', filename)
+    if filename.lower().endswith('.csv'):
+        rows = _csv_rows(filename)
+    else:
+        rows = _xlsx_rows(filename)
+    parsed = 0
+    try:
+        titles = next(rows)
+        logger.info('Loading -> %s', ', '.join(str(title) for title in titles))
+
+        assert 'Data do Negócio' == titles[col.date]
+        assert 'Tipo de Movimentação' == titles[col.type_]
+        assert 'Código de Negociação' == titles[col.code]
+        assert 'Quantidade' == titles[col.quantity]
+        assert 'Preço' == titles[col.price]
+
+        decode_date = _date_decoder()
+        # (row number, total, exported total) of the rows that do not match
+        mismatches = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for line, row in enumerate(rows, start=2):
+            # read only sheets may report trailing empty rows
+            if row[col.date] is None:
+                continue
+            parsed += 1
+            if debug:
+                logger.debug(row)
+
+            op_type = row[col.type_].upper()
+            if op_type == 'COMPRA':
+                operation_type = Buy
+            else:
+                assert op_type == 'VENDA'
+                operation_type = Sell
+
+            quantity = row[col.quantity]
+            assert isinstance(quantity, int)
+            price = row[col.price]
+            if type(price) is not float:
+                price = float(price)
+
+            operation = operation_type(
+                row[col.code], quantity, price, decode_date(row[col.date])
+            )
+            total = round(operation.total, 2)
+            exported = round(row[col.total], 2)
+            if total != exported:
+                mismatches.append((line, total, exported))
+            yield operation
+
+        _check_totals(filename, mismatches)
+    finally:
+        rows.close()
+        metrics.count('rows_parsed', parsed)
+
+
+def _iter_b3_export(filename, cache=True):
+    """Yield the operations of a B3 export, from the cache when possible"""
+    if not cache:
+        yield from _iter_b3_file(filename)
+        return
+
+    path = b3cache.cache_path(filename, PARSER_VERSION)
+    stream = b3cache.load(path)
+    if stream is not None:
+        metrics.count('cache.hits')
+        yield from stream
+        return
+
+    metrics.count('cache.misses')
+    stream = b3cache.OperationStream()
+    for operation in _iter_b3_file(filename):
+        stream.append(operation)
+        yield operation
+    b3cache.save(path, stream)
+
+
+def _parse_b3_file(filename, columnar=False, cache=True):
+    """Group the operations of a B3 export by stock
+
+    With ``columnar`` each stock is kept in an OperationColumns instead of a
+    list, which is much smaller for large exports. Parsed exports are cached
+    unless ``cache`` is False.
+    """
+    year = 0
+    stocks = {}
+    for operation in _iter_b3_export(filename, cache=cache):
+        # validate there is a single year in the Excel sheet
+        if not year:
+            year = operation.date.year
+        assert year == operation.date.year
+
+        if operation.stock not in stocks:
+            if columnar:
+                stocks[operation.stock] = OperationColumns(operation.stock)
+            else:
+                stocks[operation.stock] = []
+        stocks[operation.stock].append(operation)
 
-    workbook.close()
     return {year: stocks}
 
 
-def load_b3_file():
-    xlsx_filenames = []
+def load_b3_files(filenames, cache=True):
+    """Parse many B3 exports, grouping their operations by year and stock
+
+    Each export is sorted on its own and then merged, so exports covering the
+    same period can be given in any order.
+    """
+    years = {}
+    for filename in filenames:
+        exported = {}
+        for operation in _iter_b3_export(filename, cache=cache):
+            stocks = exported.setdefault(operation.date.year, {})
+            stocks.setdefault(operation.stock, []).append(operation)
+
+        for year, stocks in exported.items():
+            merged = years.setdefault(year, {})
+            for stock, operations in stocks.items():
+                operations.sort(key=attrgetter('date'))
+                if stock in merged:
+                    operations = list(chronological(merged[stock], operations))
+                merged[stock] = operations
+
+    logger.info('Loaded years %s', ', '.join(str(year) for year in sorted(years)))
+    return years
+
+
+def load_b3_file(cache=True):
+    export_filenames = []
     logger.info('Loading B3 file')
     for filename in os.listdir(os.path.dirname(__file__).replace('taxes', '')):
-        if filename.endswith('xlsx'):
-            xlsx_filenames.append(filename)
+        if filename.lower().endswith(EXPORT_EXTENSIONS):
+            export_filenames.append(filename)
 
-    assert len(xlsx_filenames) == 1
+    assert len(export_filenames) == 1
 
-    return _parse_b3_file(xlsx_filenames[0])
+    return _parse_b3_file(export_filenames[0], cache=cache)
 
 
-def pretty_json(year: int, content: dict):
+def pretty_json(year: int, content: dict, directory='.'):
     dump_args = {
         'sort_keys': True,
         'indent': 4,
         'ensure_ascii': False,
     }
-    with open(f'posicoes-finais.{year}.json', 'w', encoding='utf-8') as outfile:
+    filename = os.path.join(directory, f'posicoes-finais.{year}.json')
+    with open(filename, 'w', encoding='utf-8') as outfile:
         json.dump(content, outfile, **dump_args)
         outfile.write('\n')
 
 
-def save_output(stocks):
-    content = {}
-    for stock in stocks:
-        if not stock.accumulated_quantity():
-            continue
-
-        content[stock.stock] = {
-            'total': round(
-                stock.accumulated_quantity() * stock.accumulated_average(), 2
-            ),
-            'preco-medio': round(stock.accumulated_average(), 9),
-            'quantidade': stock.accumulated_quantity(),
-        }
-    pretty_json(stocks[0].year, content)
+def save_output(report, directory='.'):
+    """Save the year end positions of a prepared taxes.report.Report"""
+    pretty_json(report.year, report.positions(), directory=directory)
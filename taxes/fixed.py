@@ -0,0 +1,180 @@
+"""Fixed point money, for exact results
+
+Money is kept as an integer number of millionths of real, enough for the B3
+prices and the preco-medio of posicoes-*.json. Quantities are integers, so
+totals are exact and the only rounding is the cost of the shares of a sale,
+to the nearest millionth. That rounding stays in the position: every real
+bought is either sold at cost or still held.
+"""
+from calendar import month_name
+
+from taxes.data import Buy
+from taxes.data import Sell
+from taxes.data import chronological
+from taxes.events import BONUS
+from taxes.events import Event
+
+SCALE = 1_000_000
+# reais, the float engine is expected to agree within a centavo
+TOLERANCE = 0.01
+
+
+def to_fixed(value):
+    # prices have at most 6 decimals, well within a float at this scale
+    return round(value * SCALE)
+
+
+def from_fixed(value):
+    return value / SCALE
+
+
+def _divide(numerator, denominator):
+    """Integer division rounding half to even, as round() does"""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+class FixedLedger:
+    """Average cost of a stock in fixed point, the exact taxes.data.Ledger
+
+    Only the year end position and the monthly sums are kept, enough for the
+    report and for cross_check().
+    """
+
+    def __init__(self, previous_total, previous_quantity, operations):
+        self.total = to_fixed(previous_total)
+        self.quantity = previous_quantity
+        self.sold = [0] * 12
+        self.costs = [0] * 12
+        for operation in operations:
+            self.apply(operation)
+
+    @classmethod
+    def of(cls, year):
+        """Ledger of the same operations as a YearOperations"""
+        # the operations before a restored state are not kept
+        assert not year.restored, f'{year.stock} restored from a state'
+        operations = chronological(year.events, year.operations)
+        return cls(year.previous_total, year.previous_quantity, operations)
+
+    def apply(self, operation):
+        if isinstance(operation, Buy):
+            self.total += to_fixed(operation.price) * operation.quantity
+            self.quantity += operation.quantity
+        elif isinstance(operation, Sell):
+            month = operation.date.month - 1
+            cost = _divide(self.total * operation.quantity, self.quantity)
+            self.total -= cost
+            self.quantity -= operation.quantity
+            self.costs[month] += cost
+            self.sold[month] += to_fixed(operation.price) * operation.quantity
+        elif isinstance(operation, Event):
+            quantity = operation.quantity(self.quantity)
+            if operation.kind == BONUS:
+                self.total += (quantity - self.quantity) * to_fixed(operation.cost)
+            self.quantity = quantity
+        else:
+            raise TypeError('Only buy, sell or events allowed')
+
+    @property
+    def results(self):
+        return [sold - cost for sold, cost in zip(self.sold, self.costs)]
+
+    @property
+    def average(self):
+        if not self.quantity:
+            return 0.0
+        return self.total / self.quantity / SCALE
+
+    def position(self):
+        """Year end position as YearOperations.position(), rounded exactly"""
+        if not self.quantity:
+            return None
+        return {
+            # centavos and billionths of real, rounded from the integers
+            'total': _divide(self.total, SCALE // 100) / 100,
+            'preco-medio': _divide(self.total * 1000, self.quantity) / 10**9,
+            'quantidade': self.quantity,
+        }
+
+
+class FixedTotals:
+    """Cross-stock monthly sums of the fixed point ledgers
+
+    Same interface as taxes.report.MonthlyTotals. Day trades are matched by
+    YearOperations at the day average prices, their results are converted.
+    """
+
+    def __init__(self, stocks):
+        self.stocks = stocks
+        self.ledgers = [FixedLedger.of(year) for year in stocks]
+        self._sold = [0] * 12
+        self._results = [0] * 12
+        self._day_trade_results = [0] * 12
+        for year, ledger in zip(stocks, self.ledgers):
+            self._add(year, ledger)
+
+    def _add(self, year, ledger, sign=1):
+        for month_number, result in enumerate(ledger.results):
+            self._sold[month_number] += sign * ledger.sold[month_number]
+            self._results[month_number] += sign * result
+            self._day_trade_results[month_number] += sign * to_fixed(
+                year.day_trade_results[month_number]
+            )
+
+    def replace(self, row, previous, year):
+        """The stock at ``row`` changed from ``previous`` to ``year``
+
+        Integer sums are exact, the previous ledger is taken out and the new
+        one added without going over the other stocks.
+        """
+        self._add(previous, self.ledgers[row], sign=-1)
+        self.ledgers[row] = FixedLedger.of(year)
+        self._add(year, self.ledgers[row])
+
+    def sold_by_month(self):
+        return [from_fixed(sold) for sold in self._sold]
+
+    def results_by_month(self):
+        return [from_fixed(result) for result in self._results]
+
+    def day_trade_results_by_month(self):
+        return [from_fixed(result) for result in self._day_trade_results]
+
+    def quantities(self):
+        return [ledger.quantity for ledger in self.ledgers]
+
+    def averages(self):
+        return [ledger.average for ledger in self.ledgers]
+
+
+def cross_check(year, ledger=None, tolerance=TOLERANCE):
+    """Differences over ``tolerance`` between a YearOperations and its
+    fixed point ledger, as messages for the log"""
+    if ledger is None:
+        ledger = FixedLedger.of(year)
+
+    mismatches = []
+    for month_number, month in enumerate(year.months):
+        result = month.loss + month.profit
+        exact = from_fixed(ledger.results[month_number])
+        if abs(result - exact) > tolerance:
+            mismatches.append(
+                f'{year.stock} {month_name[month_number + 1]} result {result} '
+                f'exact {exact}'
+            )
+
+    if year.accumulated_quantity() != ledger.quantity:
+        mismatches.append(
+            f'{year.stock} quantity {year.accumulated_quantity()} '
+            f'exact {ledger.quantity}'
+        )
+    total = year.accumulated_quantity() * year.accumulated_average()
+    if abs(total - from_fixed(ledger.total)) > tolerance:
+        mismatches.append(
+            f'{year.stock} total {total} exact {from_fixed(ledger.total)}'
+        )
+    return mismatches
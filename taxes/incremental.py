@@ -0,0 +1,284 @@
+"""Incremental updates of a year, from the state saved by the previous run
+
+For every stock the state keeps the YearOperations checkpoint at the start of
+the last processed day, the operations of that day and the number of trades
+applied. An update replays that day and the new trades only, so a daily
+update takes time proportional to the trades of the day, with the same
+results as parsing the whole year again.
+
+Exports cover whole days: trades before the last processed day were already
+applied and are skipped, trades on that day replace the saved ones. Stocks
+without new trades or corporate events are restored closed, as the last
+update left them, without replaying anything.
+
+A year opens with the closing of the previous one. When that closing changes,
+the saved state of the year is thrown away and the year is computed again
+from the exports of the update, since the state does not keep every trade.
+
+The years only keep the operations applied since the checkpoint, so the fixed
+point engine and its cross-check, which rebuild a ledger from every
+operation of the year, are not available for updates.
+"""
+import json
+import logging
+import os
+from datetime import date
+from operator import attrgetter
+
+from taxes import metrics
+from taxes import profiling
+from taxes.columns import BUY
+from taxes.columns import SELL
+from taxes.data import Buy
+from taxes.data import Sell
+from taxes.data import YearOperations
+from taxes.report import Portfolio
+from taxes.report import Report
+
+logger = logging.getLogger(__name__)
+
+# bump when the state changes, older states are computed again
+STATE_VERSION = 4
+STATE_FILENAME = 'estado.{year}.json'
+
+
+def state_path(directory, year):
+    return os.path.join(directory, STATE_FILENAME.format(year=year))
+
+
+def load_state(path):
+    """Saved state, None when missing or from another version"""
+    try:
+        with open(path, encoding='utf-8') as infile:
+            state = json.load(infile)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning('Ignoring invalid state %s', path)
+        return None
+
+    if state.get('version') != STATE_VERSION:
+        logger.warning('Ignoring state %s from another version', path)
+        return None
+    return state
+
+
+def save_state(path, state):
+    # written aside and renamed, an interrupted run keeps the previous state
+    partial = f'{path}.tmp'
+    with open(partial, 'w', encoding='utf-8') as outfile:
+        json.dump(state, outfile)
+    os.replace(partial, path)
+
+
+def new_state(year, positions, accumulated_loss=0.0, accumulated_day_trade_loss=0.0):
+    """State of a year with no trades, from its opening positions"""
+    return {
+        'version': STATE_VERSION,
+        'year': year,
+        'accumulated_loss': accumulated_loss,
+        'accumulated_day_trade_loss': accumulated_day_trade_loss,
+        'stocks': {
+            stock: _stock_state(position, 0, None, [], None, None)
+            for stock, position in positions.items()
+        },
+    }
+
+
+def _stock_state(previous, trades, last_date, last_day, checkpoint, closed):
+    return {
+        'previous': previous,
+        'trades': trades,
+        'last_date': last_date.toordinal() if last_date else None,
+        'last_day': [
+            [
+                BUY if isinstance(operation, Buy) else SELL,
+                operation.quantity,
+                operation.price,
+            ]
+            for operation in last_day
+        ],
+        'checkpoint': checkpoint,
+        # the year at the end of the update, restored when nothing changed
+        'closed': closed,
+    }
+
+
+def _last_day(stock, last_date, rows):
+    return [
+        (Buy if side == BUY else Sell)(stock, quantity, price, last_date)
+        for side, quantity, price in rows
+    ]
+
+
+def update_stock(stock, year, stock_state, operations=(), events=()):
+    """Closed YearOperations of a stock and its new state
+
+    Only the saved last day and the operations after it are applied.
+    """
+    previous = {}
+    checkpoint = None
+    last_date = None
+    last_day = []
+    trades = 0
+    if stock_state is not None:
+        previous = stock_state['previous']
+        checkpoint = stock_state['checkpoint']
+        if stock_state['last_date'] is not None:
+            last_date = date.fromordinal(stock_state['last_date'])
+            last_day = _last_day(stock, last_date, stock_state['last_day'])
+        trades = stock_state['trades'] - len(last_day)
+
+    operations = sorted(operations, key=attrgetter('date'))
+    same_day = [operation for operation in operations if operation.date == last_date]
+    pending = (same_day or last_day) + [
+        operation
+        for operation in operations
+        if last_date is None or operation.date > last_date
+    ]
+    metrics.count('incremental.replayed', len(pending))
+
+    closed = []
+    if pending:
+        last_date = pending[-1].date
+        closed = [operation for operation in pending if operation.date < last_date]
+        last_day = pending[len(closed) :]
+
+    year_operations = YearOperations(
+        stock, year, previous, closed, state=checkpoint, close=False, events=events
+    )
+    checkpoint = year_operations.state()
+    year_operations.extend(last_day)
+    year_operations.close()
+    year_operations.calculate_loss_or_profit()
+    return year_operations, _stock_state(
+        previous,
+        trades + len(pending),
+        last_date,
+        last_day,
+        checkpoint,
+        year_operations.state(),
+    )
+
+
+def restore_stock(stock, year, stock_state):
+    """Closed YearOperations of a stock as the last update left it"""
+    year_operations = YearOperations(
+        stock, year, stock_state['previous'], [], state=stock_state['closed']
+    )
+    year_operations.calculate_loss_or_profit()
+    return year_operations
+
+
+@profiling.profiled('prepare')
+def update(state, operations, events=None):
+    """Apply the new operations of the state year, {stock: operations}
+
+    ``state`` is updated in place. Returns the prepared Report of the year.
+    The same ``events`` have to be given to every update of a year.
+    """
+    year = state['year']
+    stocks = []
+    for stock in sorted(set(state['stocks']) | set(operations)):
+        stock_state = state['stocks'].get(stock)
+        stock_events = events.for_stock(stock, year) if events else ()
+        if (
+            not operations.get(stock)
+            and not stock_events
+            and stock_state is not None
+            and stock_state['closed'] is not None
+        ):
+            stocks.append(restore_stock(stock, year, stock_state))
+            metrics.count('incremental.restored')
+            continue
+
+        year_operations, state['stocks'][stock] = update_stock(
+            stock, year, stock_state, operations.get(stock, ()), stock_events
+        )
+        stocks.append(year_operations)
+
+    current = {stock: details['previous'] for stock, details in state['stocks'].items()}
+    report = Report(
+        current,
+        {year: {}},
+        accumulated_loss=state['accumulated_loss'],
+        accumulated_day_trade_loss=state['accumulated_day_trade_loss'],
+    )
+    report.stocks = Portfolio(stocks)
+    report.summarize()
+    return report
+
+
+def _closing(directory, year, report, events):
+    """Report of the year before ``year``, from this run or its saved state"""
+    if report is not None and report.year == year - 1:
+        return report
+    previous = load_state(state_path(directory, year - 1))
+    if previous is None:
+        return None
+    return update(previous, {}, events)
+
+
+def _opened_with(state, report):
+    """Whether ``state`` opened with the closing of ``report``"""
+    opening = {
+        stock: details['previous']
+        for stock, details in state['stocks'].items()
+        if details['previous']
+    }
+    return (
+        opening == report.positions()
+        and state['accumulated_loss'] == report.taxes[-1].accumulated_loss
+        and state['accumulated_day_trade_loss']
+        == report.day_trade_taxes[-1].accumulated_loss
+    )
+
+
+def run_years(initial_positions, b3input, directory='.', events=None):
+    """Update the state of every year of ``b3input`` in order, yield the reports
+
+    A year without a saved state opens with the closing of the previous year,
+    from this run or its saved state, or with ``initial_positions``. A saved
+    state opened with another closing of the previous year, changed since, is
+    thrown away and the year is computed again from its exports in
+    ``b3input``, which have to cover the whole year.
+    """
+    report = None
+    for year in sorted(b3input):
+        logger.info('==============')
+        logger.info('Year %s', year)
+        path = state_path(directory, year)
+        state = load_state(path)
+        report = _closing(directory, year, report, events)
+        if state is not None and report is not None and not _opened_with(state, report):
+            logger.warning(
+                'The closing of %s changed, %s is computed again from its exports',
+                year - 1,
+                year,
+            )
+            metrics.count('incremental.recomputed')
+            state = None
+        if state is None:
+            if report is None:
+                state = new_state(year, initial_positions)
+            else:
+                state = new_state(
+                    year,
+                    report.positions(),
+                    report.taxes[-1].accumulated_loss,
+                    report.day_trade_taxes[-1].accumulated_loss,
+                )
+        report = update(state, b3input[year], events)
+        save_state(path, state)
+        yield report
+
+    if report is not None:
+        following = load_state(state_path(directory, report.year + 1))
+        if following is not None and not _opened_with(following, report):
+            # its trades are not kept, only its exports can compute it again
+            logger.warning(
+                'The saved state of %s opened with another closing of %s, '
+                'update it with all of its exports',
+                report.year + 1,
+                report.year,
+            )
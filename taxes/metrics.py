@@ -0,0 +1,88 @@
+"""Counters and timers for the hot paths
+
+Everything is a no-op until enable() is called, so instrumented code costs a
+global lookup when metrics are off. Counters are summed by name and timers
+keep the total wall time and number of calls, see summary().
+"""
+import functools
+import time
+from contextlib import nullcontext
+
+_enabled = False
+_counters = {}
+_timers = {}
+_NULL_TIMER = nullcontext()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    reset()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    _counters.clear()
+    _timers.clear()
+
+
+def count(name, value=1):
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        seconds, calls = _timers.get(self.name, (0.0, 0))
+        _timers[self.name] = (seconds + elapsed, calls + 1)
+
+
+def timer(name):
+    """Context manager timing a block under ``name``"""
+    if _enabled:
+        return _Timer(name)
+    return _NULL_TIMER
+
+
+def timed(name):
+    """Decorator timing every call of a function under ``name``"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summary():
+    return {
+        'counters': dict(sorted(_counters.items())),
+        'timers': {
+            name: {'seconds': round(seconds, 6), 'calls': calls}
+            for name, (seconds, calls) in sorted(_timers.items())
+        },
+    }
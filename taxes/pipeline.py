@@ -0,0 +1,146 @@
+"""Parse the exports while the years already parsed are reported
+
+Every export is parsed in a process pool as soon as the pipeline starts. The
+parsed operations are streamed, one stock at a time, through a bounded queue
+to the reports. A year is reported once an export of a later year comes in,
+and its output is written in a thread while the next year is prepared. The
+wall time gets close to the slowest of parsing and reporting, not their sum.
+
+Exports have to be given in chronological order, as B3 exports periods. A
+parsed export is queued whole, and the last year of an export is only known
+to be complete when the next export is parsed, or at the end of the input.
+When an export fails to parse, the years reported before it are written and
+the year in progress is neither reported nor written.
+"""
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from taxes.data import chronological
+from taxes.file_handlers import load_b3_files
+from taxes.report import Report
+
+logger = logging.getLogger(__name__)
+
+# stocks parsed and waiting to be reported
+QUEUE_SIZE = 256
+# queued after the last export, or instead of the rest when parsing fails
+_END = None
+_FAILED = object()
+
+
+async def _produce(filenames, queue, executor, cache):
+    loop = asyncio.get_running_loop()
+    # all the exports are submitted at once, the pool bounds how many run
+    parsing = [
+        loop.run_in_executor(executor, load_b3_files, [filename], cache)
+        for filename in filenames
+    ]
+    try:
+        for filename, parsed in zip(filenames, parsing):
+            b3input = await parsed
+            logger.info('Parsed %s', filename)
+            for year in sorted(b3input):
+                for stock, operations in b3input[year].items():
+                    await queue.put((year, stock, operations))
+    except Exception:
+        for parsed in parsing:
+            parsed.cancel()
+        # the reports stop, run_pipeline raises this error
+        await queue.put(_FAILED)
+        raise
+    await queue.put(_END)
+
+
+async def _consume(queue, years):
+    year = None
+    stocks = {}
+    while (item := await queue.get()) is not _END:
+        if item is _FAILED:
+            # the year in progress is missing exports, it is not reported
+            await asyncio.gather(*years.writing)
+            return
+        item_year, stock, operations = item
+        if year is not None and item_year < year:
+            raise ValueError(f'Exports out of order, {item_year} after {year}')
+        if year is not None and item_year > year:
+            await years.report(year, stocks)
+            stocks = {}
+        year = item_year
+        if stock in stocks:
+            operations = list(chronological(stocks[stock], operations))
+        stocks[stock] = operations
+
+    if year is not None:
+        await years.report(year, stocks)
+    await asyncio.gather(*years.writing)
+
+
+class _Years:
+    """Reports the years in order, chaining positions and losses"""
+
+    def __init__(self, initial_positions, write, **options):
+        self.positions = initial_positions
+        self.accumulated_loss = 0.0
+        self.accumulated_day_trade_loss = 0.0
+        self.write = write
+        self.options = options
+        self.reports = []
+        self.writing = []
+
+    async def report(self, year, stocks):
+        report = Report(
+            self.positions,
+            {year: stocks},
+            accumulated_loss=self.accumulated_loss,
+            accumulated_day_trade_loss=self.accumulated_day_trade_loss,
+            **self.options,
+        )
+        # in a thread, so the parsed exports keep coming in
+        await asyncio.to_thread(report.prepare)
+        self.positions = report.positions()
+        self.accumulated_loss = report.taxes[-1].accumulated_loss
+        self.accumulated_day_trade_loss = report.day_trade_taxes[-1].accumulated_loss
+        self.reports.append(report)
+        if self.write:
+            # written while the next year is prepared, in order
+            previous = self.writing[-1] if self.writing else None
+            self.writing.append(asyncio.create_task(self._write(previous, report)))
+
+    async def _write(self, previous, report):
+        if previous is not None:
+            await previous
+        await asyncio.to_thread(self.write, report)
+
+
+async def run_pipeline(
+    initial_positions,
+    filenames,
+    write=None,
+    workers=None,
+    cache=True,
+    queue_size=QUEUE_SIZE,
+    **options,
+):
+    """Reports of every year of the exports, ``write`` is called with each one
+
+    ``options`` go to every Report, like ``engine`` or ``events``.
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+    years = _Years(initial_positions, write, **options)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        producer = asyncio.create_task(_produce(filenames, queue, executor, cache))
+        try:
+            await _consume(queue, years)
+        except BaseException:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            raise
+        # raises the error that stopped the parsing, if any
+        await producer
+    return years.reports
+
+
+def run(initial_positions, filenames, **options):
+    """run_pipeline() from synchronous code"""
+    return asyncio.run(run_pipeline(initial_positions, filenames, **options))
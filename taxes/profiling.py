@@ -0,0 +1,215 @@
+"""Per phase profiles of a run, see ``run.py --profile``
+
+Like taxes.metrics, everything is a no-op until enable() is called. Each
+phase, like 'prepare' or 'save_output', gets its own cProfile.Profile and the
+wall time, CPU time and peak traced memory of its calls, summed over the
+years. tracemalloc and cProfile slow the run down, the times are meant to be
+compared with each other, not with an unprofiled run.
+
+Phases nested in another phase of the same thread are part of the outer one.
+CPU time is the process time: phases overlapping in threads, as with
+--pipeline, or work done in process pools, as with --workers, are not
+attributed precisely.
+"""
+import cProfile
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from dataclasses import field
+
+PSTATS_EXTENSION = '.pstats'
+# self time of each stack, the input of flamegraph.pl, speedscope or inferno
+FOLDED_FILENAME = 'profile.folded'
+COMBINED_FILENAME = f'profile{PSTATS_EXTENSION}'
+
+_enabled = False
+_phases = {}
+_active = threading.local()
+
+
+@dataclass
+class Phase:
+    name: str
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    # bytes allocated over what was in use when a call started
+    peak_memory: int = 0
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile, repr=False)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    _phases.clear()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _enabled
+
+
+def phases():
+    return list(_phases.values())
+
+
+class _Profiling:
+    __slots__ = ('phase', 'wall', 'cpu', 'memory')
+
+    def __init__(self, name):
+        phase = _phases.get(name)
+        if phase is None:
+            phase = _phases[name] = Phase(name)
+        self.phase = phase
+
+    def __enter__(self):
+        _active.phase = self.phase
+        tracemalloc.reset_peak()
+        self.memory = tracemalloc.get_traced_memory()[0]
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.phase.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.phase.profile.disable()
+        phase = self.phase
+        phase.calls += 1
+        phase.wall += time.perf_counter() - self.wall
+        phase.cpu += time.process_time() - self.cpu
+        peak = tracemalloc.get_traced_memory()[1] - self.memory
+        phase.peak_memory = max(phase.peak_memory, peak)
+        _active.phase = None
+
+
+class _Nothing:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NOTHING = _Nothing()
+
+
+def phase(name):
+    """Context manager profiling a block as the phase ``name``"""
+    if not _enabled or getattr(_active, 'phase', None) is not None:
+        return _NOTHING
+    return _Profiling(name)
+
+
+def profiled(name):
+    """Decorator profiling every call of a function as the phase ``name``"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def table():
+    """The phases as lines of text, in the order they first ran"""
+    lines = [
+        f'{"fase":<16} {"chamadas":>8} {"tempo (s)":>10} {"cpu (s)":>10} '
+        f'{"pico (MiB)":>10}'
+    ]
+    for phase in _phases.values():
+        lines.append(
+            f'{phase.name:<16} {phase.calls:>8} {phase.wall:>10.3f} '
+            f'{phase.cpu:>10.3f} {phase.peak_memory / 2**20:>10.1f}'
+        )
+    return lines
+
+
+def _label(function):
+    filename, line, name = function
+    if filename == '~':
+        # builtins, like <built-in method builtins.len>
+        return name.strip('<>')
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def folded(stats, root):
+    """Folded stacks of a pstats.Stats, one 'a;b;c microseconds' per line
+
+    cProfile only keeps the callers of each function, not whole stacks. The
+    stack of a function follows the caller it spent the most time under, and
+    its self time under each caller is put on top of that caller's stack.
+    """
+    entries = stats.stats
+    stacks = {}
+
+    def stack(function, seen=()):
+        if function in stacks:
+            return stacks[function]
+        callers = entries[function][4]
+        candidates = [caller for caller in callers if caller not in seen]
+        if not candidates:
+            result = (root, _label(function))
+        else:
+            # the edge of a caller is (primitive calls, calls, self, cumulative)
+            caller = max(candidates, key=lambda caller: callers[caller][3])
+            result = stack(caller, seen + (function,)) + (_label(function),)
+        if not seen:
+            stacks[function] = result
+        return result
+
+    lines = []
+    for function, (_, _, tottime, _, callers) in entries.items():
+        if callers:
+            parts = [
+                (stack(caller) + (_label(function),), edge[2])
+                for caller, edge in callers.items()
+            ]
+        else:
+            parts = [(stack(function), tottime)]
+        for frames, seconds in parts:
+            microseconds = round(seconds * 1_000_000)
+            if microseconds:
+                lines.append(f'{";".join(frames)} {microseconds}')
+    return sorted(lines)
+
+
+def save(directory):
+    """Write {phase}.pstats, all of them in profile.pstats and profile.folded"""
+    # only needed at the end of a profiled run
+    import pstats
+
+    os.makedirs(directory, exist_ok=True)
+    combined = None
+    lines = []
+    for phase in _phases.values():
+        stats = pstats.Stats(phase.profile)
+        stats.dump_stats(os.path.join(directory, f'{phase.name}{PSTATS_EXTENSION}'))
+        lines.extend(folded(stats, phase.name))
+        if combined is None:
+            combined = pstats.Stats(phase.profile)
+        else:
+            combined.add(phase.profile)
+    if combined is not None:
+        combined.dump_stats(os.path.join(directory, COMBINED_FILENAME))
+    with open(os.path.join(directory, FOLDED_FILENAME), 'w') as outfile:
+        for line in lines:
+            outfile.write(line + '\n')
@@ -1,75 +1,346 @@
 import logging
 from calendar import month_name
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 
+from taxes import metrics
+from taxes import profiling
 from taxes.data import Buy
 from taxes.data import YearOperations
+from taxes.fixed import FixedTotals
+from taxes.fixed import cross_check
+from taxes.tax import DAY_TRADE_RATE
+from taxes.tax import assess
+from taxes.tradefile import StockTrades
 
 logger = logging.getLogger(__name__)
 
+ENGINES = ('python', 'numpy', 'fixed')
+# stocks sent to a worker at once, when running in parallel
+CHUNKS_PER_WORKER = 4
+
+
+def prepare_stock(stock, input_, operations, events=()):
+    # this runs for every stock, skip building the messages when quiet
+    verbose = logger.isEnabledFor(logging.INFO)
+    if verbose:
+        logger.info('--------------')
+        logger.info('Reporting for %s', stock)
+        logger.info('Input: %s', input_)
+        logger.info('Total operations %s', len(operations))
+    if isinstance(operations, StockTrades):
+        year = operations.year_operations(input_, events)
+    else:
+        year = YearOperations(
+            stock, operations[0].date.year, input_, operations, events=events
+        )
+    if verbose:
+        logger.info(
+            'buy %s sell %s remaining stock %s',
+            year.accumulated_average(),
+            year.accumulated_average(operation_type='SELL'),
+            year.accumulated_quantity(),
+        )
+    year.calculate_loss_or_profit()
+    return year
+
+
+def _prepare_stock(args):
+    return prepare_stock(*args)
+
+
+class Portfolio(Sequence):
+    """YearOperations of the stocks of a report, indexed by ticker
+
+    A list wherever the stocks of a report are read, in report order, and
+    stock() finds the year of a ticker without a scan.
+    """
+
+    def __init__(self, stocks=()):
+        self._stocks = []
+        # ticker: row in _stocks
+        self._rows = {}
+        for year in stocks:
+            self.append(year)
+
+    def __len__(self):
+        return len(self._stocks)
+
+    def __getitem__(self, index):
+        return self._stocks[index]
+
+    def __iter__(self):
+        return iter(self._stocks)
+
+    def tickers(self):
+        return self._rows.keys()
+
+    def row(self, stock):
+        return self._rows[stock]
+
+    def stock(self, stock):
+        return self._stocks[self._rows[stock]]
+
+    def append(self, year):
+        assert year.stock not in self._rows, year.stock
+        self._rows[year.stock] = len(self._stocks)
+        self._stocks.append(year)
+
+    def replace(self, year):
+        """Put ``year`` in the place of the same stock, returns (row, previous)"""
+        row = self._rows[year.stock]
+        previous = self._stocks[row]
+        self._stocks[row] = year
+        return row, previous
+
+
+class MonthlyTotals:
+    """Cross-stock sums for every month, one stock at a time
+
+    The sums are computed in a single pass over the stocks, replace() only
+    takes a stock out and adds its new year. This is the reference
+    implementation, the numpy engine has to match it.
+    """
+
+    def __init__(self, stocks):
+        self.stocks = stocks
+        self._sold = [0.0] * 12
+        self._results = [0.0] * 12
+        self._day_trade_results = [0.0] * 12
+        for year in stocks:
+            self._add(year)
+
+    def _add(self, year, sign=1.0):
+        for month_number, month in enumerate(year.months):
+            self._sold[month_number] += sign * month.sell.total
+            # even though it will mostly be 0.0, I'd rather not accumulate
+            # error doing floating point operations
+            self._results[month_number] += sign * (month.loss + month.profit)
+            self._day_trade_results[month_number] += (
+                sign * year.day_trade_results[month_number]
+            )
+
+    def replace(self, row, previous, year):
+        """The stock at ``row`` changed from ``previous`` to ``year``
+
+        ``previous`` is taken out of the sums and ``year`` added, the totals
+        can differ from a fresh pass over the stocks in the last bits.
+        """
+        self._add(previous, sign=-1.0)
+        self._add(year)
+
+    def sold_by_month(self):
+        return list(self._sold)
+
+    def results_by_month(self):
+        return list(self._results)
+
+    def day_trade_results_by_month(self):
+        return list(self._day_trade_results)
+
+    def quantities(self):
+        return [year.accumulated_quantity() for year in self.stocks]
+
+    def averages(self):
+        return [year.accumulated_average() for year in self.stocks]
+
 
 class Report:
-    def __init__(self, current_position, b3input):
+    def __init__(
+        self,
+        current_position,
+        b3input,
+        engine='python',
+        workers=None,
+        accumulated_loss=0.0,
+        accumulated_day_trade_loss=0.0,
+        cross_check=False,
+        events=None,
+    ):
         # at least one operation is required and 1 year only
         assert len(b3input) == 1
+        assert engine in ENGINES
         self.year = list(b3input.keys())[0]
         self.current = current_position
         self.b3input = b3input[self.year]
-        self.stocks = []
+        self.engine = engine
+        # stocks are prepared in a process pool when set
+        self.workers = workers
+        # losses of previous years still to be compensated, negative
+        self.accumulated_loss = accumulated_loss
+        self.accumulated_day_trade_loss = accumulated_day_trade_loss
+        # compare every stock with the fixed point engine
+        self.cross_check = cross_check
+        self.mismatches = []
+        # mismatches of each stock, by row
+        self._mismatches = []
+        # EventIndex of the corporate events, if any
+        self.events = events
+        self.stocks = Portfolio()
+        self.totals = None
+        self.taxes = []
+        self.day_trade_taxes = []
 
+    @metrics.timed('report.prepare')
+    @profiling.profiled('prepare')
     def prepare(self):
-        self.stocks = []
-        for stock, operations in self.b3input.items():
-            logger.info('--------------')
-            logger.info('Reporting for %s', stock)
-            input_ = self.current.get(stock, {})
-            logger.info('Input: %s', input_)
-            logger.info('Total operations %s', len(operations))
-            year = YearOperations(stock, operations[0].date.year, input_, operations)
-            logger.info(
-                'buy %s sell %s remaining stock %s',
-                year.accumulated_average(),
-                year.accumulated_average(operation_type='SELL'),
-                year.accumulated_quantity(),
+        jobs = [
+            (
+                stock,
+                self.current.get(stock, {}),
+                operations,
+                self._events(stock),
             )
-            self.stocks.append(year)
-            year.calculate_loss_or_profit()
+            for stock, operations in self.b3input.items()
+        ]
+        if metrics.is_enabled():
+            for stock, _, operations, _ in jobs:
+                metrics.count(f'operations.{stock}', len(operations))
+        if self.workers:
+            # map keeps the input order, so the output matches a serial run
+            chunksize = max(1, len(jobs) // (self.workers * CHUNKS_PER_WORKER))
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                self.stocks = Portfolio(
+                    executor.map(_prepare_stock, jobs, chunksize=chunksize)
+                )
+        else:
+            self.stocks = Portfolio(prepare_stock(*job) for job in jobs)
 
-        # stocks with no operations
-        no_ops = set(self.current.keys()) - set(self.b3input.keys())
+        # stocks with no operations, in the order of the positions
+        no_ops = [stock for stock in self.current if stock not in self.b3input]
         year = self.stocks[0].year
         for stock in no_ops:
             logger.info('--------------')
             logger.info('%s had no change in %s', stock, year)
-            self.stocks.append(
-                YearOperations(
-                    stock,
-                    self.year,
-                    self.current[stock],
-                    [],
-                )
+            self.stocks.append(self.prepare_stock(stock, []))
+
+        self.summarize()
+
+    def _events(self, stock):
+        if self.events is None:
+            return []
+        return self.events.for_stock(stock, self.year)
+
+    def prepare_stock(self, stock, operations):
+        """YearOperations of ``stock`` in this report, with ``operations``"""
+        if not operations:
+            return YearOperations(
+                stock,
+                self.year,
+                self.current.get(stock, {}),
+                [],
+                events=self._events(stock),
             )
+        return prepare_stock(
+            stock, self.current.get(stock, {}), operations, self._events(stock)
+        )
 
-        logger.info('--------------')
-        for month in range(12):
-            sold = 0.0
-            for stock_ops in self.stocks:
-                sold += stock_ops.months[month].sell.total
+    def summarize(self):
+        """Cross-stock totals and taxes of the prepared stocks"""
+        if self.engine == 'numpy':
+            from taxes.vectorized import PortfolioArrays
+
+            self.totals = PortfolioArrays(self.stocks)
+        elif self.engine == 'fixed':
+            self.totals = FixedTotals(self.stocks)
+        else:
+            self.totals = MonthlyTotals(self.stocks)
 
+        if self.cross_check:
+            self._mismatches = [
+                self._cross_check(row, year) for row, year in enumerate(self.stocks)
+            ]
+            self.mismatches = [
+                mismatch for stock in self._mismatches for mismatch in stock
+            ]
+
+        logger.info('--------------')
+        for month, sold in enumerate(self.totals.sold_by_month()):
             logger.info(
                 'On %s you sold %s total', month_name[month + 1], round(sold, 2)
             )
+        self._assess()
+
+    def _cross_check(self, row, year):
+        ledgers = getattr(self.totals, 'ledgers', None)
+        mismatches = cross_check(year, ledgers[row] if ledgers else None)
+        for mismatch in mismatches:
+            logger.warning('Cross-check: %s', mismatch)
+        metrics.count('cross_check.mismatches', len(mismatches))
+        return mismatches
+
+    def _assess(self):
+        self.taxes = assess(
+            self.totals.sold_by_month(),
+            self.totals.results_by_month(),
+            self.accumulated_loss,
+        )
+        # day trades have no exemption and compensate only day trade losses
+        self.day_trade_taxes = assess(
+            [0.0] * 12,
+            self.totals.day_trade_results_by_month(),
+            self.accumulated_day_trade_loss,
+            exemption_limit=None,
+            rate=DAY_TRADE_RATE,
+        )
+
+    def replace(self, year):
+        """Put the YearOperations ``year`` in the place of the same stock
+
+        Meant for what-if questions, like report.prepare_stock() with other
+        operations: only the totals of that stock change and the taxes of the
+        year are assessed again, the other stocks are not prepared again.
+        Returns the YearOperations replaced, replace() it back to undo.
+        """
+        row, previous = self.stocks.replace(year)
+        self.totals.replace(row, previous, year)
+        if self.cross_check:
+            self._mismatches[row] = self._cross_check(row, year)
+            self.mismatches = [
+                mismatch for stock in self._mismatches for mismatch in stock
+            ]
+        self._assess()
+        return previous
+
+    def stock(self, stock):
+        """YearOperations of a stock"""
+        return self.stocks.stock(stock)
+
+    def position(self, stock):
+        """Year end position of a stock, None when none is held"""
+        return self._position(self.stocks.row(stock))
+
+    def _position(self, row):
+        # the fixed point ledgers are exact, their positions are carried
+        ledgers = getattr(self.totals, 'ledgers', None)
+        if ledgers:
+            return ledgers[row].position()
+        return self.stocks[row].position()
+
+    def positions(self):
+        """Year end positions, the opening positions of the next year"""
+        positions = {}
+        for row, year in enumerate(self.stocks):
+            position = self._position(row)
+            if position:
+                positions[year.stock] = position
+        return positions
 
+    @metrics.timed('report.net_worth')
+    @profiling.profiled('net_worth')
     def net_worth(self):
         logger.info('--------------')
         logger.info('BENS E DIREITOS')
         logger.info('Grupo 3 - Participações societárias')
         logger.info('Código 1 - Ações (inclusive as listadas em bolsa)')
-        for year in self.stocks:
+        quantities = self.totals.quantities()
+        averages = self.totals.averages()
+        for year, quantity, average in zip(self.stocks, quantities, averages):
             logger.info(
                 '%s - %s ACOES - PRECO MEDIO %s',
                 year.stock,
-                year.accumulated_quantity(),
-                round(year.accumulated_average(), 5),
+                quantity,
+                round(average, 5),
             )
 
             logger.info(
@@ -77,9 +348,11 @@ class Report:
                 year.year - 1,
                 year.previous_total,
                 year.year,
-                round(year.accumulated_quantity() * year.accumulated_average(), 2),
+                round(quantity * average, 2),
             )
 
+    @metrics.timed('report.profit')
+    @profiling.profiled('profit')
     def profit(self):
         logger.info('--------------')
         logger.info('RENDIMENTOS ISENTOS E NÃO TRIBUTÁVEIS')
@@ -88,31 +361,84 @@ class Report:
             'ações negociadas em bolsa de valores nas alienações realizadas até '
             'R$ 20.000,00 em cada mês, para o conjuto de ações'
         )
-        tax_free = 0.0
-        for month_number in range(12):
-            total = 0.0
-            for stock in self.stocks:
-                month = stock.months[month_number]
-                total += month.loss + month.profit
-            if total > 0.0:
-                tax_free += total
-        logger.info('Valor %s', round(tax_free, 2))
+        exempt = 0.0
+        for tax in self.taxes:
+            exempt += tax.exempt
+        logger.info('Valor %s', round(exempt, 2))
 
+    @metrics.timed('report.losses')
+    @profiling.profiled('losses')
     def losses(self):
         logger.info('--------------')
         logger.info(
             'RENDA VARIÁVEL - GANHOS LÍQUIDOS OU PERDAS EM OPERAÇÕES COMUNS/DAY-'
             'TRADE - TITULAR'
         )
-        for month_number in range(12):
-            loss = 0.0
-            for stock in self.stocks:
-                # even though it will mostly be 0.0, I'd rather not accumulate error
-                # doing floating point operations
-                month = stock.months[month_number]
-                loss += month.loss + month.profit
+        for tax, day_trade in zip(self.taxes, self.day_trade_taxes):
             logger.info(
-                '%s Mercado à Vista %s',
-                month_name[month_number + 1],
-                round(loss, 2),
+                '%s Mercado à Vista %s Day-Trade %s',
+                month_name[tax.month],
+                round(tax.result, 2),
+                round(day_trade.result, 2),
             )
+            if tax.taxable:
+                logger.info(
+                    'Vendas de %s acima de R$ 20.000,00, ganho tributável %s, '
+                    'prejuízo compensado %s, imposto devido %s',
+                    round(tax.sold, 2),
+                    round(tax.taxable, 2),
+                    round(tax.compensated, 2),
+                    tax.tax_due,
+                )
+            if day_trade.taxable:
+                logger.info(
+                    'Day-trade ganho tributável %s, prejuízo compensado %s, '
+                    'imposto devido %s',
+                    round(day_trade.taxable, 2),
+                    round(day_trade.compensated, 2),
+                    day_trade.tax_due,
+                )
+
+        accumulated_loss = self.taxes[-1].accumulated_loss if self.taxes else 0.0
+        logger.info('Prejuízo a compensar %s', round(accumulated_loss, 2))
+        accumulated_loss = (
+            self.day_trade_taxes[-1].accumulated_loss if self.day_trade_taxes else 0.0
+        )
+        logger.info('Prejuízo a compensar (day-trade) %s', round(accumulated_loss, 2))
+
+
+def run_years(
+    initial_positions,
+    b3input,
+    engine='python',
+    workers=None,
+    cross_check=False,
+    events=None,
+):
+    """Prepare one report per year, in order
+
+    The closing positions of each year are the opening positions of the next
+    one, as if posicoes-finais.{year}.json was copied to posicoes-iniciais.json.
+    Losses not compensated in a year are carried to the next one.
+    """
+    positions = initial_positions
+    accumulated_loss = 0.0
+    accumulated_day_trade_loss = 0.0
+    for year in sorted(b3input):
+        logger.info('==============')
+        logger.info('Year %s', year)
+        report = Report(
+            positions,
+            {year: b3input[year]},
+            engine=engine,
+            workers=workers,
+            accumulated_loss=accumulated_loss,
+            accumulated_day_trade_loss=accumulated_day_trade_loss,
+            cross_check=cross_check,
+            events=events,
+        )
+        report.prepare()
+        yield report
+        positions = report.positions()
+        accumulated_loss = report.taxes[-1].accumulated_loss
+        accumulated_day_trade_loss = report.day_trade_taxes[-1].accumulated_loss
@@ -0,0 +1,225 @@
+"""SQLite store of trades and monthly results, for many years and accounts
+
+Exports are ingested once, keyed by their content, and the trades of an
+account are then read back in the shape load_b3_files returns, without
+parsing any workbook. Trades are indexed on (account, stock, date), so the
+trades of a stock in a period are an index lookup.
+"""
+import logging
+import sqlite3
+from datetime import date
+
+from taxes import cache as b3cache
+from taxes.columns import BUY
+from taxes.columns import SELL
+from taxes.data import Buy
+from taxes.data import Sell
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT = 'default'
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    account TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    PRIMARY KEY (account, digest)
+);
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    stock TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    side INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_account_stock_date
+    ON trades (account, stock, date);
+CREATE TABLE IF NOT EXISTS monthly_results (
+    account TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    stock TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    sold REAL NOT NULL,
+    result REAL NOT NULL,
+    day_trade_result REAL NOT NULL,
+    PRIMARY KEY (account, year, stock, month)
+);
+"""
+
+
+def _year_range(year):
+    return date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal()
+
+
+def _operation(stock, day, side, quantity, price):
+    operation_type = Buy if side == BUY else Sell
+    return operation_type(stock, quantity, price, date.fromordinal(day))
+
+
+class Store:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _insert(self, operations, account):
+        rows = (
+            (
+                account,
+                operation.stock,
+                operation.date.toordinal(),
+                BUY if isinstance(operation, Buy) else SELL,
+                operation.quantity,
+                operation.price,
+            )
+            for operation in operations
+        )
+        cursor = self.connection.executemany(
+            """
+            INSERT INTO trades (account, stock, date, side, quantity, price)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        return cursor.rowcount
+
+    def add_operations(self, operations, account=DEFAULT_ACCOUNT):
+        """Insert operations in bulk, in a single transaction"""
+        with self.connection:
+            return self._insert(operations, account)
+
+    def ingest(self, filename, account=DEFAULT_ACCOUNT, cache=True):
+        """Add the trades of a B3 export, unless it was ingested before
+
+        Returns the number of trades added.
+        """
+        from taxes.file_handlers import _iter_b3_export
+
+        digest = b3cache.digest(filename, 'store')
+        with self.connection:
+            ingested = self.connection.execute(
+                'SELECT 1 FROM exports WHERE account = ? AND digest = ?',
+                (account, digest),
+            ).fetchone()
+            if ingested:
+                logger.info('%s was already ingested for %s', filename, account)
+                return 0
+
+            self.connection.execute(
+                'INSERT INTO exports (account, digest, filename) VALUES (?, ?, ?)',
+                (account, digest, filename),
+            )
+            added = self._insert(_iter_b3_export(filename, cache=cache), account)
+        logger.info('Ingested %s trades of %s for %s', added, filename, account)
+        return added
+
+    def accounts(self):
+        rows = self.connection.execute('SELECT DISTINCT account FROM trades')
+        return sorted(account for account, in rows)
+
+    def years(self, account=DEFAULT_ACCOUNT):
+        first, last = self.connection.execute(
+            'SELECT MIN(date), MAX(date) FROM trades WHERE account = ?', (account,)
+        ).fetchone()
+        if first is None:
+            return []
+        return list(
+            range(date.fromordinal(first).year, date.fromordinal(last).year + 1)
+        )
+
+    def operations(self, account=DEFAULT_ACCOUNT, year=None):
+        """{year: {stock: operations}}, as load_b3_files returns
+
+        Trades of the same date keep the order they were ingested in.
+        """
+        query = """
+            SELECT stock, date, side, quantity, price FROM trades
+            WHERE account = ?
+        """
+        parameters = [account]
+        if year is not None:
+            query += ' AND date BETWEEN ? AND ?'
+            parameters.extend(_year_range(year))
+        query += ' ORDER BY date, id'
+
+        years = {}
+        for stock, day, side, quantity, price in self.connection.execute(
+            query, parameters
+        ):
+            operation = _operation(stock, day, side, quantity, price)
+            stocks = years.setdefault(operation.date.year, {})
+            stocks.setdefault(stock, []).append(operation)
+        return years
+
+    def stock_operations(self, stock, year, account=DEFAULT_ACCOUNT, side=None):
+        """Operations of a stock in a year, only buys or sells with ``side``"""
+        query = """
+            SELECT stock, date, side, quantity, price FROM trades
+            WHERE account = ? AND stock = ? AND date BETWEEN ? AND ?
+        """
+        parameters = [account, stock, *_year_range(year)]
+        if side is not None:
+            query += ' AND side = ?'
+            parameters.append(side)
+        query += ' ORDER BY date, id'
+        return [_operation(*row) for row in self.connection.execute(query, parameters)]
+
+    def sells(self, stock, year, account=DEFAULT_ACCOUNT):
+        return self.stock_operations(stock, year, account=account, side=SELL)
+
+    def save_results(self, report, account=DEFAULT_ACCOUNT):
+        """Monthly results of every stock of a prepared Report"""
+        rows = [
+            (
+                account,
+                year.year,
+                year.stock,
+                month.month,
+                month.sell.total,
+                year.operation_results[month.month - 1],
+                year.day_trade_results[month.month - 1],
+            )
+            for year in report.stocks
+            for month in year.months
+        ]
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM monthly_results WHERE account = ? AND year = ?',
+                (account, report.year),
+            )
+            self.connection.executemany(
+                """
+                INSERT INTO monthly_results
+                (account, year, stock, month, sold, result, day_trade_result)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+    def results(self, year, account=DEFAULT_ACCOUNT, stock=None):
+        """{stock: [(sold, result, day trade result)] * 12} saved for a year"""
+        query = """
+            SELECT stock, sold, result, day_trade_result FROM monthly_results
+            WHERE account = ? AND year = ?
+        """
+        parameters = [account, year]
+        if stock is not None:
+            query += ' AND stock = ?'
+            parameters.append(stock)
+        query += ' ORDER BY stock, month'
+
+        results = {}
+        for stock_, *values in self.connection.execute(query, parameters):
+            results.setdefault(stock_, []).append(tuple(values))
+        return results
@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+
+# monthly sales up to this value have tax free gains (Lei 11.033/2004)
+EXEMPTION_LIMIT = 20000.00
+COMMON_RATE = 0.15
+DAY_TRADE_RATE = 0.20
+
+
+@dataclass
+class MonthlyTax:
+    month: int
+    sold: float
+    result: float
+    exempt: float = 0.0
+    taxable: float = 0.0
+    # loss of previous months used against this month gain
+    compensated: float = 0.0
+    # losses still to be compensated after this month, negative like month.loss
+    accumulated_loss: float = 0.0
+    tax_due: float = 0.0
+
+
+def assess(
+    sold_by_month,
+    results_by_month,
+    accumulated_loss=0.0,
+    exemption_limit=EXEMPTION_LIMIT,
+    rate=COMMON_RATE,
+):
+    """Split the results of the whole portfolio in exempt and taxable gains
+
+    Losses are carried forward and compensated against the following taxable
+    gains. Without an ``exemption_limit`` every gain is taxable.
+    """
+    months = []
+    for month, (sold, result) in enumerate(zip(sold_by_month, results_by_month), 1):
+        tax = MonthlyTax(month, sold, result)
+        if result < 0.0:
+            accumulated_loss += result
+        elif exemption_limit is not None and round(sold, 2) <= exemption_limit:
+            tax.exempt = result
+        else:
+            # max() keeps it 0.0, not -0.0, when no loss is carried
+            tax.compensated = min(result, max(0.0, -accumulated_loss))
+            accumulated_loss += tax.compensated
+            tax.taxable = result - tax.compensated
+            tax.tax_due = round(tax.taxable * rate, 2)
+        tax.accumulated_loss = accumulated_loss
+        months.append(tax)
+
+    return months
@@ -0,0 +1,255 @@
+"""Memory mapped columnar file of the trades of a year
+
+The file has a header, an index of the stocks and one column per field:
+day ordinals, quantities, prices scaled by taxes.fixed.SCALE and sides. The
+trades of each stock are contiguous and in date order, so the index keeps
+the fixed width ticker with the slice of rows it owns.
+
+Columns are read in place through memoryviews of the mapping, nothing is
+copied when a file is opened. StockTrades works wherever a list of the
+operations of a stock is expected, and pickles as the file path and ticker,
+so process pool workers map the file themselves instead of receiving the
+operations. Reports build the year of a stock from the columns with
+StockTrades.year_operations(), without an operation per row.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import date
+
+from taxes.columns import BUY
+from taxes.columns import SELL
+from taxes.columns import OperationColumns
+from taxes.data import Buy
+from taxes.data import DayTradeIndex
+from taxes.data import Sell
+from taxes.data import YearOperations
+from taxes.fixed import SCALE
+from taxes.fixed import to_fixed
+
+MAGIC = b'IRACOES\0'
+VERSION = 1
+EXTENSION = '.trades'
+# magic, version, year, byteorder, stocks, rows
+HEADER = struct.Struct('<8sHHcxxxQQ')
+TICKER_WIDTH = 12
+# ticker, first row, rows
+INDEX_ENTRY = struct.Struct(f'<{TICKER_WIDTH}sQQ')
+# (name, array typecode) in the order they are written
+COLUMNS = (
+    ('dates', 'i'),
+    ('quantities', 'q'),
+    ('prices', 'q'),
+    ('sides', 'b'),
+)
+BYTEORDER = {'little': b'<', 'big': b'>'}
+ALIGNMENT = 8
+
+
+def _padding(offset):
+    return -offset % ALIGNMENT
+
+
+def write_trade_file(path, b3input):
+    """Write the {year: {stock: operations}} of a single year"""
+    assert len(b3input) == 1
+    ((year, stocks),) = b3input.items()
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    index = []
+    for stock in sorted(stocks):
+        ticker = stock.encode('ascii')
+        assert len(ticker) <= TICKER_WIDTH, stock
+        operations = sorted(stocks[stock], key=lambda operation: operation.date)
+        index.append(INDEX_ENTRY.pack(ticker, len(columns['dates']), len(operations)))
+        for operation in operations:
+            columns['dates'].append(operation.date.toordinal())
+            columns['quantities'].append(operation.quantity)
+            columns['prices'].append(to_fixed(operation.price))
+            columns['sides'].append(BUY if isinstance(operation, Buy) else SELL)
+
+    rows = len(columns['dates'])
+    # written aside and renamed, readers never map a partial file
+    with open(f'{path}.tmp', 'wb') as file:
+        file.write(
+            HEADER.pack(
+                MAGIC, VERSION, year, BYTEORDER[sys.byteorder], len(index), rows
+            )
+        )
+        file.write(b''.join(index))
+        for name, _ in COLUMNS:
+            file.write(b'\0' * _padding(file.tell()))
+            columns[name].tofile(file)
+    os.replace(f'{path}.tmp', path)
+
+
+class TradeFile:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, year, byteorder, stocks, rows = HEADER.unpack_from(
+                self._mmap
+            )
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{path} is not a trade file')
+            if byteorder != BYTEORDER[sys.byteorder]:
+                raise ValueError('Trade file written on a different architecture')
+
+            self.year = year
+            self.index = {}
+            offset = HEADER.size
+            for _ in range(stocks):
+                ticker, start, count = INDEX_ENTRY.unpack_from(self._mmap, offset)
+                self.index[ticker.rstrip(b'\0').decode('ascii')] = (start, count)
+                offset += INDEX_ENTRY.size
+
+            self.columns = {}
+            view = memoryview(self._mmap)
+            for name, typecode in COLUMNS:
+                offset += _padding(offset)
+                end = offset + rows * array(typecode).itemsize
+                self.columns[name] = view[offset:end].cast(typecode)
+                offset = end
+            view.release()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for column in getattr(self, 'columns', {}).values():
+            column.release()
+        self.columns = {}
+        self._mmap.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, stock):
+        start, count = self.index[stock]
+        return StockTrades(self, stock, start, count)
+
+    def b3input(self):
+        """{year: {stock: StockTrades}}, as _parse_b3_file returns"""
+        return {self.year: {stock: self[stock] for stock in self.index}}
+
+
+# files mapped by this process, shared by every StockTrades unpickled in it,
+# {path: ((mtime, size), TradeFile)}
+_open_files = {}
+
+
+def open_trade_file(path):
+    """TradeFile of ``path``, mapped again when the file was rewritten"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _open_files.get(path)
+    if cached is None or cached[0] != version:
+        # a replaced file is not closed, StockTrades may still read it
+        cached = _open_files[path] = (version, TradeFile(path))
+    return cached[1]
+
+
+def _stock_trades(path, stock):
+    return open_trade_file(path)[stock]
+
+
+class StockTrades:
+    """The rows of a stock in a TradeFile, as operations built on access"""
+
+    __slots__ = ('file', 'stock', 'start', 'count')
+
+    def __init__(self, file, stock, start, count):
+        self.file = file
+        self.stock = stock
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        row = self.start + index
+        columns = self.file.columns
+        operation_type = Buy if columns['sides'][row] == BUY else Sell
+        return operation_type(
+            self.stock,
+            columns['quantities'][row],
+            columns['prices'][row] / SCALE,
+            date.fromordinal(columns['dates'][row]),
+        )
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def year_operations(self, previous_year, events=()):
+        """YearOperations of the stock, the same as from its operations
+
+        Each column is read once, only the days with day trades build
+        anything besides the rows.
+        """
+        columns = self.file.columns
+        end = self.start + self.count
+        days = columns['dates'][self.start : end].tolist()
+        quantities = columns['quantities'][self.start : end].tolist()
+        prices = [price / SCALE for price in columns['prices'][self.start : end]]
+        sides = columns['sides'][self.start : end].tolist()
+
+        rows = OperationColumns(self.stock)
+        day_trades = []
+        first = 0
+        while first < self.count:
+            last = first + 1
+            while last < self.count and days[last] == days[first]:
+                last += 1
+            if len(set(sides[first:last])) == 1:
+                for row in range(first, last):
+                    rows.append_row(days[row], quantities[row], prices[row], sides[row])
+            else:
+                date_ = date.fromordinal(days[first])
+                index = DayTradeIndex()
+                for row in range(first, last):
+                    total = round(prices[row] * quantities[row], 6)
+                    index.add_row(
+                        self.stock, date_, quantities[row], total, sides[row] == BUY
+                    )
+                trade, remainder = index.split_day(self.stock, date_)
+                day_trades.append(trade)
+                if remainder:
+                    rows.append_row(
+                        days[first],
+                        remainder.quantity,
+                        remainder.price,
+                        BUY if isinstance(remainder, Buy) else SELL,
+                    )
+            first = last
+
+        year = YearOperations(
+            self.stock, self.file.year, previous_year, [], close=False, events=events
+        )
+        year.extend_rows(rows, day_trades)
+        year.close()
+        return year
+
+    def __reduce__(self):
+        return _stock_trades, (self.file.path, self.stock)
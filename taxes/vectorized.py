@@ -0,0 +1,97 @@
+from itertools import chain
+
+import numpy as np
+
+
+MONTHS = 12
+# ledger snapshots: the previous year and the end of every month
+SNAPSHOTS = MONTHS + 1
+
+
+def _stack(rows, count, width, dtype):
+    """(count x width) array of the lists ``rows``, converted at once"""
+    values = np.fromiter(chain.from_iterable(rows), dtype, count * width)
+    return values.reshape(count, width)
+
+
+class PortfolioArrays:
+    """Cross-stock monthly sums computed with numpy
+
+    The monthly snapshots of every stock ledger are stacked in (stocks x 13)
+    arrays, read with a single conversion each instead of a month at a time,
+    and every month of every stock is computed at once. The monthly sums are
+    kept as arrays. It follows the same operations as MonthlyTotals and
+    YearOperations, so both engines give the same numbers.
+    """
+
+    def __init__(self, stocks):
+        count = len(stocks)
+        ledgers = [year.ledger for year in stocks]
+        # the snapshots are running totals, a month is the difference
+        self.sell_quantity = np.diff(
+            _stack(
+                (ledger.sell_quantity for ledger in ledgers), count, SNAPSHOTS, np.int64
+            )
+        )
+        self.sell_total = np.diff(
+            _stack((ledger.sell_total for ledger in ledgers), count, SNAPSHOTS, float)
+        )
+        # trades are applied in order, so the costs come from the ledgers
+        self.costs = _stack((ledger.costs for ledger in ledgers), count, MONTHS, float)
+        self.day_trade_results = _stack(
+            (year.day_trade_results for year in stocks), count, MONTHS, float
+        )
+        # corporate events change the position too, the year end position
+        # comes from the ledgers
+        self.quantity = np.fromiter(
+            (ledger.quantity[MONTHS] for ledger in ledgers), np.int64, count
+        )
+        self.average = np.fromiter(
+            (ledger.average[MONTHS] for ledger in ledgers), float, count
+        )
+
+        self.results = np.where(
+            self.sell_quantity > 0, self.sell_total - self.costs, 0.0
+        )
+        self.sold = self.sell_total.sum(axis=0)
+        self.results_sum = self.results.sum(axis=0)
+        self.day_trade_sum = self.day_trade_results.sum(axis=0)
+
+    def replace(self, row, previous, year):
+        """The stock at ``row`` changed from ``previous`` to ``year``
+
+        Only that row is filled again, the monthly sums take the difference.
+        """
+        ledger = year.ledger
+        sell_quantity = np.diff(np.array(ledger.sell_quantity, np.int64))
+        sell_total = np.diff(np.array(ledger.sell_total, float))
+        costs = np.array(ledger.costs, float)
+        results = np.where(sell_quantity > 0, sell_total - costs, 0.0)
+        day_trade_results = np.array(year.day_trade_results, float)
+
+        self.sold += sell_total - self.sell_total[row]
+        self.results_sum += results - self.results[row]
+        self.day_trade_sum += day_trade_results - self.day_trade_results[row]
+
+        self.sell_quantity[row] = sell_quantity
+        self.sell_total[row] = sell_total
+        self.costs[row] = costs
+        self.results[row] = results
+        self.day_trade_results[row] = day_trade_results
+        self.quantity[row] = ledger.quantity[MONTHS]
+        self.average[row] = ledger.average[MONTHS]
+
+    def sold_by_month(self):
+        return self.sold.tolist()
+
+    def results_by_month(self):
+        return self.results_sum.tolist()
+
+    def day_trade_results_by_month(self):
+        return self.day_trade_sum.tolist()
+
+    def quantities(self):
+        return self.quantity.tolist()
+
+    def averages(self):
+        return self.average.tolist()
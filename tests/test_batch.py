@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from taxes.batch import Account
+from taxes.batch import find_accounts
+from taxes.batch import run_batch
+from tests.test_file_handlers import write_b3_file
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.accounts = os.path.join(self.tmpdir.name, 'contas')
+        self.output = os.path.join(self.tmpdir.name, 'saida')
+        for name, quantity in (('ana', 100), ('bia', 30)):
+            os.makedirs(os.path.join(self.accounts, name))
+            write_b3_file(
+                os.path.join(self.accounts, name, 'negociacao.xlsx'),
+                [
+                    ('02/01/2023', 'Compra', 'STOC4', quantity, 1.5),
+                    ('02/02/2023', 'Venda', 'STOC4', 10, 2.0),
+                ],
+            )
+        with open(
+            os.path.join(self.accounts, 'ana', 'posicoes-iniciais.json'), 'w'
+        ) as file:
+            json.dump(
+                {'HOLD3': {'total': 10.0, 'preco-medio': 1.0, 'quantidade': 10}}, file
+            )
+        # an account with a broken initial positions file
+        os.makedirs(os.path.join(self.accounts, 'caio'))
+        write_b3_file(
+            os.path.join(self.accounts, 'caio', 'negociacao.xlsx'),
+            [('02/01/2023', 'Compra', 'STOC4', 1, 1.5)],
+        )
+        with open(
+            os.path.join(self.accounts, 'caio', 'posicoes-iniciais.json'), 'w'
+        ) as file:
+            file.write('{')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def positions(self, account):
+        filename = os.path.join(self.output, account, 'posicoes-finais.2023.json')
+        with open(filename) as file:
+            return json.load(file)
+
+    def test_directory(self):
+        accounts = find_accounts(self.accounts)
+        self.assertEqual([account.name for account in accounts], ['ana', 'bia', 'caio'])
+        self.assertIsNotNone(accounts[0].initial)
+
+        results = {
+            result['account']: result
+            for result in run_batch(accounts, self.output, workers=2, cache=False)
+        }
+        self.assertEqual(
+            results['ana'], {'account': 'ana', 'years': [2023], 'error': None}
+        )
+        self.assertEqual(results['bia']['years'], [2023])
+        # one account failing does not stop the others
+        self.assertEqual(results['caio']['years'], [])
+        self.assertIn('SystemExit', results['caio']['error'])
+
+        self.assertEqual(sorted(self.positions('ana')), ['HOLD3', 'STOC4'])
+        self.assertEqual(self.positions('bia')['STOC4']['quantidade'], 20)
+
+    def test_manifest(self):
+        manifest = os.path.join(self.tmpdir.name, 'contas.json')
+        with open(manifest, 'w') as file:
+            json.dump(
+                {
+                    'bia': {'exports': ['contas/bia/negociacao.xlsx']},
+                    'zeca': {'initial': 'faltando.json', 'exports': []},
+                },
+                file,
+            )
+        accounts = find_accounts(manifest)
+        self.assertEqual(
+            accounts[0],
+            Account(
+                'bia', None, [os.path.join(self.accounts, 'bia', 'negociacao.xlsx')]
+            ),
+        )
+
+        results = sorted(
+            run_batch(accounts, self.output, workers=1, cache=False),
+            key=lambda result: result['account'],
+        )
+        self.assertIsNone(results[0]['error'])
+        self.assertIn('FileNotFoundError', results[1]['error'])
@@ -0,0 +1,26 @@
+import logging
+import os
+import tempfile
+from unittest import TestCase
+
+from benchmarks.bench import bench_size
+
+
+class TestBench(TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_small_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            timings = bench_size(directory, 100, 1)
+            written = [
+                name
+                for name in os.listdir(directory)
+                if name.startswith('posicoes-finais')
+            ]
+        self.assertGreaterEqual(timings['rows'], 100)
+        self.assertIn('report.losses', timings)
+        self.assertEqual(len(written), 1)
@@ -0,0 +1,268 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from taxes import cli
+from taxes import metrics
+from taxes import profiling
+from tests.test_file_handlers import write_b3_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestArguments(TestCase):
+    def test_default_command(self):
+        self.assertEqual(cli._with_command([]), ['report'])
+        self.assertEqual(cli._with_command(['-v']), ['-v', 'report'])
+        self.assertEqual(
+            cli._with_command(['-v', 'a.xlsx', 'b.csv']),
+            ['-v', 'report', 'a.xlsx', 'b.csv'],
+        )
+        self.assertEqual(cli._with_command(['parse', 'a.xlsx']), ['parse', 'a.xlsx'])
+        self.assertEqual(cli._with_command(['--help']), ['--help'])
+        self.assertEqual(
+            cli._with_command(['--metrics', 'out.json', 'a.xlsx']),
+            ['--metrics', 'out.json', 'report', 'a.xlsx'],
+        )
+        self.assertEqual(
+            cli._with_command(['-q', '--no-cache', 'a2023.xlsx']),
+            ['-q', 'report', '--no-cache', 'a2023.xlsx'],
+        )
+        self.assertEqual(
+            cli._with_command(['-q', '--workers', '2', 'a2023.xlsx']),
+            ['-q', 'report', '--workers', '2', 'a2023.xlsx'],
+        )
+        self.assertEqual(
+            cli._with_command(['--profile=perfil', '--engine', 'fixed']),
+            ['--profile=perfil', 'report', '--engine', 'fixed'],
+        )
+        args = cli.build_parser().parse_args(
+            cli._with_command(['-q', '--workers', '2', 'a2023.xlsx'])
+        )
+        self.assertEqual((args.workers, args.exports), (2, ['a2023.xlsx']))
+
+    def test_commands(self):
+        parser = cli.build_parser()
+        args = parser.parse_args(['report', 'a.xlsx', '--workers', '2'])
+        self.assertIs(args.command, cli.report)
+        self.assertEqual(args.exports, ['a.xlsx'])
+        self.assertEqual(args.workers, 2)
+        args = parser.parse_args(['positions', '--engine', 'numpy'])
+        self.assertIs(args.command, cli.positions)
+        self.assertEqual(args.engine, 'numpy')
+
+    def test_light_imports(self):
+        script = (
+            'import sys\n'
+            'from taxes import cli\n'
+            'cli.build_parser().parse_args(["parse"])\n'
+            'heavy = {"openpyxl", "numpy", "taxes.report", "taxes.file_handlers"}\n'
+            'assert not heavy & set(sys.modules), heavy & set(sys.modules)\n'
+        )
+        subprocess.run([sys.executable, '-c', script], check=True, cwd=ROOT)
+
+
+class TestCommands(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.export = os.path.join(self.tmpdir.name, 'negociacao.xlsx')
+        self.initial = os.path.join(self.tmpdir.name, 'posicoes-iniciais.json')
+        write_b3_file(
+            self.export,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+                ('02/02/2023', 'Venda', 'STOC4', 50, 2.0),
+            ],
+        )
+        with open(self.initial, 'w') as file:
+            json.dump(
+                {'HOLD3': {'total': 10.0, 'preco-medio': 1.0, 'quantidade': 10}}, file
+            )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_main(self, *argv):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(cli.main(argv), 0)
+        return json.loads(output.getvalue())
+
+    def test_parse(self):
+        self.assertEqual(self.run_main('parse', self.export), {'2023': {'STOC4': 2}})
+
+    def test_positions(self):
+        self.assertEqual(
+            self.run_main('positions', self.export, '--initial', self.initial),
+            {
+                '2023': {
+                    'HOLD3': {'preco-medio': 1.0, 'quantidade': 10, 'total': 10.0},
+                    'STOC4': {'preco-medio': 1.5, 'quantidade': 50, 'total': 75.0},
+                }
+            },
+        )
+
+    def test_metrics(self):
+        summary = os.path.join(self.tmpdir.name, 'metrics.json')
+        try:
+            self.run_main(
+                '-q',
+                '--metrics',
+                summary,
+                'positions',
+                '--no-cache',
+                '--initial',
+                self.initial,
+                self.export,
+            )
+        finally:
+            metrics.disable()
+        with open(summary) as file:
+            content = json.load(file)
+        self.assertEqual(content['counters']['rows_parsed'], 2)
+        self.assertEqual(content['counters']['operations.STOC4'], 2)
+        self.assertIn('parse', content['timers'])
+        self.assertIn('report.prepare', content['timers'])
+
+    def test_profile(self):
+        directory = os.path.join(self.tmpdir.name, 'perfil')
+        errors = io.StringIO()
+        try:
+            with redirect_stderr(errors):
+                self.run_main(
+                    '-q',
+                    '--profile',
+                    directory,
+                    'positions',
+                    '--no-cache',
+                    '--initial',
+                    self.initial,
+                    self.export,
+                )
+        finally:
+            profiling.disable()
+        phases = [line.split()[0] for line in errors.getvalue().splitlines()[1:]]
+        self.assertEqual(phases, ['load_input_file', 'load_b3_file', 'prepare'])
+        for phase in phases:
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{phase}.pstats')))
+        self.assertTrue(os.path.exists(os.path.join(directory, 'profile.folded')))
+
+    def test_update(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            for _ in range(2):
+                self.assertEqual(
+                    cli.main(['-q', 'update', self.export, '--initial', self.initial]),
+                    0,
+                )
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmpdir.name, 'estado.2023.json'))
+        )
+        with open(os.path.join(self.tmpdir.name, 'posicoes-finais.2023.json')) as file:
+            self.assertEqual(json.load(file)['STOC4']['quantidade'], 50)
+
+    def test_store(self):
+        store = os.path.join(self.tmpdir.name, 'trades.sqlite')
+        self.run_main('parse', '--store', store, self.export)
+        # read back from the store, without the export
+        self.assertEqual(
+            self.run_main('positions', '--store', store, '--initial', self.initial)[
+                '2023'
+            ]['STOC4'],
+            {'preco-medio': 1.5, 'quantidade': 50, 'total': 75.0},
+        )
+
+    def test_batch(self):
+        manifest = os.path.join(self.tmpdir.name, 'contas.json')
+        with open(manifest, 'w') as file:
+            json.dump(
+                {
+                    'ana': {
+                        'initial': 'posicoes-iniciais.json',
+                        'exports': ['negociacao.xlsx'],
+                    }
+                },
+                file,
+            )
+        output = os.path.join(self.tmpdir.name, 'saida')
+        self.assertEqual(
+            self.run_main(
+                '-q', 'batch', manifest, '--output', output, '--workers', '1'
+            ),
+            [{'account': 'ana', 'years': [2023], 'error': None}],
+        )
+        self.assertTrue(
+            os.path.exists(os.path.join(output, 'ana', 'posicoes-finais.2023.json'))
+        )
+
+    def test_trade_file(self):
+        directory = os.path.join(self.tmpdir.name, 'trades')
+        self.run_main('parse', '--write-trades', directory, self.export)
+        trade_file = os.path.join(directory, 'negociacao.2023.trades')
+        self.assertEqual(self.run_main('parse', trade_file), {'2023': {'STOC4': 2}})
+        self.assertEqual(
+            self.run_main('positions', trade_file, '--initial', self.initial)['2023'][
+                'STOC4'
+            ],
+            {'preco-medio': 1.5, 'quantidade': 50, 'total': 75.0},
+        )
+
+    def test_trade_file_and_export(self):
+        directory = os.path.join(self.tmpdir.name, 'trades')
+        self.run_main('parse', '--write-trades', directory, self.export)
+        trade_file = os.path.join(directory, 'negociacao.2023.trades')
+        export = os.path.join(self.tmpdir.name, 'outra.xlsx')
+        write_b3_file(
+            export,
+            [
+                ('03/03/2023', 'Compra', 'ACAO3', 10, 2.0),
+                ('04/03/2023', 'Venda', 'STOC4', 10, 2.0),
+            ],
+        )
+        self.assertEqual(
+            self.run_main('parse', trade_file, export),
+            {'2023': {'ACAO3': 1, 'STOC4': 3}},
+        )
+        self.assertEqual(
+            self.run_main('positions', export, trade_file, '--initial', self.initial)[
+                '2023'
+            ]['STOC4'],
+            {'preco-medio': 1.5, 'quantidade': 40, 'total': 60.0},
+        )
+
+    def test_pipeline(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            self.assertEqual(
+                cli.main(
+                    ['-q', 'report', '--pipeline', '--workers', '1']
+                    + ['--initial', self.initial, self.export]
+                ),
+                0,
+            )
+            # the exports are required
+            self.assertEqual(cli.main(['-q', 'report', '--pipeline']), 1)
+            # trade files and the store have nothing to parse
+            store = os.path.join(self.tmpdir.name, 'trades.sqlite')
+            self.assertEqual(
+                cli.main(['-q', 'report', '--pipeline', '--store', store, self.export]),
+                1,
+            )
+            self.assertFalse(os.path.exists(store))
+            self.assertEqual(
+                cli.main(['-q', 'report', '--pipeline', 'negociacao.2023.trades']), 1
+            )
+        finally:
+            os.chdir(cwd)
+        with open(os.path.join(self.tmpdir.name, 'posicoes-finais.2023.json')) as file:
+            self.assertEqual(json.load(file)['STOC4']['quantidade'], 50)
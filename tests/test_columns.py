@@ -0,0 +1,50 @@
+from datetime import date
+from unittest import TestCase
+
+from taxes import data
+from taxes.columns import OperationColumns
+
+YEAR = 2023
+NOW = date(day=1, month=1, year=YEAR)
+FEB = date(day=1, month=2, year=YEAR)
+
+
+class TestOperationColumns(TestCase):
+    def setUp(self):
+        self.operations = [
+            data.Buy(stock='STOC4', quantity=100, price=1.234567, date=NOW),
+            data.Sell(stock='STOC4', quantity=50, price=2.0, date=FEB),
+        ]
+        self.columns = OperationColumns('STOC4', self.operations)
+
+    def test_length(self):
+        self.assertEqual(len(self.columns), 2)
+
+    def test_round_trip(self):
+        self.assertEqual(list(self.columns), self.operations)
+        self.assertTrue(isinstance(self.columns[0], data.Buy))
+        self.assertTrue(isinstance(self.columns[-1], data.Sell))
+        self.assertEqual(self.columns[0].total, 123.4567)
+
+    def test_totals(self):
+        self.assertEqual(
+            list(self.columns.totals),
+            [operation.total for operation in self.operations],
+        )
+
+    def test_other_stock(self):
+        with self.assertRaises(AssertionError):
+            self.columns.append(
+                data.Buy(stock='ACAO3', quantity=100, price=1.0, date=NOW)
+            )
+
+    def test_invalid_operation(self):
+        with self.assertRaises(TypeError):
+            self.columns.append(
+                data.Operation(stock='STOC4', quantity=100, price=1.0, date=NOW)
+            )
+
+    def test_year_operations(self):
+        year = data.YearOperations('STOC4', YEAR, {}, self.columns)
+        self.assertEqual(year.accumulated_quantity(), 50)
+        self.assertEqual(year.accumulated_average(), 1.234567)
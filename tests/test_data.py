@@ -17,12 +17,91 @@ class TestOperation(TestCase):
         op = data.Buy(stock='STOC4', quantity=100, price=1.0, date=NOW)
         self.assertEqual(op.total, 100)
 
+    def test_immutable(self):
+        op = data.Buy(stock='STOC4', quantity=100, price=1.0, date=NOW)
+        with self.assertRaises(AttributeError):
+            op.quantity = 200
+
+    def test_no_instance_dict(self):
+        op = data.Sell(stock='STOC4', quantity=100, price=1.0, date=NOW)
+        self.assertFalse(hasattr(op, '__dict__'))
+
     def test_sell_type(self):
         op = data.Sell(stock='STOC4', quantity=100, price=1.0, date=NOW)
         self.assertTrue(isinstance(op, data.Sell))
         self.assertFalse(isinstance(op, data.Buy))
 
 
+class TestChronological(TestCase):
+    def test_merge(self):
+        first = [
+            data.Buy(stock='STOC4', quantity=1, price=1.0, date=NOW),
+            data.Buy(stock='STOC4', quantity=2, price=1.0, date=FEB),
+        ]
+        second = [
+            data.Sell(stock='STOC4', quantity=3, price=1.0, date=NOW),
+            data.Sell(stock='STOC4', quantity=4, price=1.0, date=FEB),
+        ]
+        self.assertEqual(
+            [op.quantity for op in data.chronological(first, second)], [1, 3, 2, 4]
+        )
+
+
+class TestDayTradeIndex(TestCase):
+    def setUp(self):
+        self.operations = [
+            data.Buy(stock='STOC4', quantity=100, price=1.0, date=NOW),
+            data.Buy(stock='ACAO3', quantity=10, price=5.0, date=NOW),
+            data.Sell(stock='STOC4', quantity=30, price=2.0, date=NOW),
+            data.Buy(stock='STOC4', quantity=100, price=2.0, date=NOW),
+            data.Sell(stock='STOC4', quantity=30, price=3.0, date=FEB),
+        ]
+        self.index = data.DayTradeIndex(self.operations)
+
+    def test_lookup(self):
+        self.assertTrue(self.index.is_day_trade('STOC4', NOW))
+        self.assertFalse(self.index.is_day_trade('ACAO3', NOW))
+        self.assertFalse(self.index.is_day_trade('STOC4', FEB))
+        self.assertIsNone(self.index.day_trade('STOC4', FEB))
+
+    def test_day_trade(self):
+        trade = self.index.day_trade('STOC4', NOW)
+        self.assertEqual(trade.quantity, 30)
+        self.assertEqual(trade.buy_price, 1.5)
+        self.assertEqual(trade.sell_price, 2.0)
+        self.assertEqual(trade.result, 15.0)
+
+    def test_split(self):
+        common, day_trades = self.index.split(self.operations)
+        self.assertEqual(
+            common,
+            [
+                data.Buy(stock='STOC4', quantity=170, price=1.5, date=NOW),
+                data.Buy(stock='ACAO3', quantity=10, price=5.0, date=NOW),
+                data.Sell(stock='STOC4', quantity=30, price=3.0, date=FEB),
+            ],
+        )
+        self.assertEqual(len(day_trades), 1)
+
+    def test_sell_remainder(self):
+        index = data.DayTradeIndex(
+            [
+                data.Sell(stock='STOC4', quantity=100, price=2.0, date=FEB),
+                data.Buy(stock='STOC4', quantity=40, price=1.0, date=FEB),
+            ]
+        )
+        common, day_trades = index.split(
+            [
+                data.Sell(stock='STOC4', quantity=100, price=2.0, date=FEB),
+                data.Buy(stock='STOC4', quantity=40, price=1.0, date=FEB),
+            ]
+        )
+        self.assertEqual(
+            common, [data.Sell(stock='STOC4', quantity=60, price=2.0, date=FEB)]
+        )
+        self.assertEqual(day_trades[0].result, 40.0)
+
+
 class TestMonthlyBucket(TestCase):
     def setUp(self):
         self.bucket = data.MonthlyBucket()
@@ -76,21 +155,64 @@ class TestMonthOperations(TestCase):
 
 
 class TestYearOpsSingleStock(TestCase):
-    # issue #1 will fix this
     def test_same_month_buy_sell(self):
-        with self.assertRaises(AssertionError):
-            data.YearOperations(
-                'STOC4',
-                YEAR,
-                {},
-                [
-                    data.Buy(stock='STOC4', quantity=100, price=1.0, date=NOW),
-                    data.Sell(stock='STOC4', quantity=100, price=1.0, date=NOW),
-                ],
-            )
+        year = data.YearOperations(
+            'STOC4',
+            YEAR,
+            {},
+            [
+                data.Buy(stock='STOC4', quantity=100, price=1.0, date=NOW),
+                data.Sell(stock='STOC4', quantity=100, price=1.0, date=NOW),
+            ],
+        )
+        year.calculate_loss_or_profit()
+        self.assertEqual(year.accumulated_quantity(), 0)
+        self.assertEqual(year.operation_results[0], 0.0)
+        # same day, so it is a day trade
+        self.assertEqual(len(year.day_trades), 1)
+        self.assertEqual(year.day_trade_results[0], 0.0)
+
+    def test_same_month_uses_trade_order(self):
+        year = data.YearOperations(
+            'STOC4',
+            YEAR,
+            {},
+            [
+                data.Buy(stock='STOC4', quantity=50, price=3.0, date=date(2023, 1, 20)),
+                data.Sell(
+                    stock='STOC4', quantity=50, price=2.0, date=date(2023, 1, 10)
+                ),
+                data.Buy(stock='STOC4', quantity=100, price=1.0, date=date(2023, 1, 2)),
+            ],
+        )
+        year.calculate_loss_or_profit()
+        # the sell happens before the second buy, at an average of 1.0
+        self.assertEqual(year.operation_results[0], 50.0)
+        self.assertEqual(year.profit, 50.0)
+        self.assertEqual(year.accumulated_quantity(), 100)
+        self.assertEqual(year.accumulated_average(), 2.0)
+
+    def test_same_month_sells_with_buy_in_between(self):
+        year = data.YearOperations(
+            'STOC4',
+            YEAR,
+            {'total': 100.0, 'quantidade': 100},
+            [
+                data.Sell(
+                    stock='STOC4', quantity=100, price=2.0, date=date(2023, 3, 1)
+                ),
+                data.Buy(stock='STOC4', quantity=100, price=4.0, date=date(2023, 3, 2)),
+                data.Sell(stock='STOC4', quantity=50, price=3.0, date=date(2023, 3, 3)),
+            ],
+        )
+        year.calculate_loss_or_profit()
+        self.assertEqual(year.operation_results[2], (200.0 - 100.0) + (150.0 - 200.0))
+        self.assertEqual(year.accumulated_quantity(month=2), 100)
+        self.assertEqual(year.accumulated_quantity(), 50)
+        self.assertEqual(year.accumulated_average(), 4.0)
 
-    # issue #2 will fix this
     def test_sell_more_than_20k_in_a_month(self):
+        # the R$ 20.000,00 exemption is checked for the whole portfolio
         year = data.YearOperations(
             'STOC4',
             YEAR,
@@ -100,8 +222,8 @@ class TestYearOpsSingleStock(TestCase):
                 data.Sell(stock='STOC4', quantity=1, price=20000.01, date=FEB),
             ],
         )
-        with self.assertRaises(AssertionError):
-            year.calculate_loss_or_profit()
+        year.calculate_loss_or_profit()
+        self.assertAlmostEqual(year.operation_results[1], 0.01)
 
     def test_calculate_loss_only_buy_ops(self):
         year = data.YearOperations(
@@ -170,7 +292,7 @@ class TestYearOpsSingleStock(TestCase):
             ],
         )
         year.calculate_loss_or_profit()
-        self.assertEqual(year.tax_free_profit, 0.0)
+        self.assertEqual(year.profit, 0.0)
 
     def test_calculate_profit_successfully(self):
         year = data.YearOperations(
@@ -183,7 +305,7 @@ class TestYearOpsSingleStock(TestCase):
             ],
         )
         year.calculate_loss_or_profit()
-        self.assertEqual(year.tax_free_profit, 100.0)
+        self.assertEqual(year.profit, 100.0)
 
     def test_calculate_profit_successfully_with_input(self):
         year = data.YearOperations(
@@ -196,7 +318,7 @@ class TestYearOpsSingleStock(TestCase):
             [data.Sell(stock='STOC4', quantity=100, price=2.0, date=FEB)],
         )
         year.calculate_loss_or_profit()
-        self.assertEqual(year.tax_free_profit, 100.0)
+        self.assertEqual(year.profit, 100.0)
 
     def test_getting_accumulated_total_no_op(self):
         year = data.YearOperations('STOC4', YEAR, {}, [])
@@ -354,3 +476,30 @@ class TestYearOpsSingleStock(TestCase):
             ],
         )
         self.assertEqual(year.accumulated_average(), 0.75)
+
+    def test_getting_accumulated_average_by_month(self):
+        year = data.YearOperations(
+            'STOC4',
+            YEAR,
+            {
+                'total': 100.0,
+                'quantidade': 100,
+            },
+            [
+                data.Buy(stock='STOC4', quantity=100, price=2.0, date=NOW),
+                data.Sell(stock='STOC4', quantity=200, price=3.0, date=FEB),
+                data.Buy(
+                    stock='STOC4',
+                    quantity=100,
+                    price=3.0,
+                    date=date(day=1, month=3, year=YEAR),
+                ),
+            ],
+        )
+        self.assertEqual(year.accumulated_average(month=0), 1.0)
+        self.assertEqual(year.accumulated_average(month=1), 1.5)
+        self.assertEqual(year.accumulated_average(month=2), 0.0)
+        self.assertEqual(year.accumulated_average(month=3), 3.0)
+        self.assertEqual(year.accumulated_average(), 3.0)
+        self.assertEqual(year.accumulated_average(operation_type='BUY'), 2.0)
+        self.assertEqual(year.accumulated_average(operation_type='SELL'), 3.0)
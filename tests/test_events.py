@@ -0,0 +1,146 @@
+import json
+import os
+import tempfile
+from datetime import date
+from fractions import Fraction
+from unittest import TestCase
+
+from taxes import data
+from taxes import incremental
+from taxes.events import BONUS
+from taxes.events import REVERSE_SPLIT
+from taxes.events import SPLIT
+from taxes.events import Event
+from taxes.events import EventIndex
+from taxes.events import load_events
+from taxes.fixed import cross_check
+from taxes.report import Report
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+YEAR = 2023
+ENGINES = ('python', 'fixed', 'numpy') if numpy else ('python', 'fixed')
+
+
+class TestEvent(TestCase):
+    def test_split(self):
+        event = Event('STOC4', date(YEAR, 3, 1), SPLIT, Fraction(2))
+        self.assertEqual(event.adjust(100, 1000.0), (200, 1000.0))
+
+    def test_reverse_split(self):
+        event = Event('STOC4', date(YEAR, 3, 1), REVERSE_SPLIT, Fraction(1, 10))
+        # the fraction is sold by the company, the cost stays
+        self.assertEqual(event.adjust(105, 1000.0), (10, 1000.0))
+
+    def test_bonus(self):
+        event = Event('STOC4', date(YEAR, 3, 1), BONUS, Fraction('0.1'), 7.5)
+        self.assertEqual(event.adjust(105, 1000.0), (115, 1075.0))
+
+    def test_invalid(self):
+        with self.assertRaises(AssertionError):
+            Event('STOC4', date(YEAR, 3, 1), 'fusao', Fraction(2))
+        with self.assertRaises(AssertionError):
+            Event('STOC4', date(YEAR, 3, 1), SPLIT, Fraction(2), 1.0)
+
+    def test_index(self):
+        events = [
+            Event('STOC4', date(YEAR + 1, 1, 2), SPLIT, Fraction(2)),
+            Event('STOC4', date(YEAR, 5, 1), SPLIT, Fraction(3)),
+            Event('STOC4', date(YEAR, 2, 1), BONUS, Fraction('0.1')),
+            Event('ACAO3', date(YEAR, 2, 1), SPLIT, Fraction(2)),
+        ]
+        index = EventIndex(events)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.for_stock('STOC4', YEAR), [events[2], events[1]])
+        self.assertEqual(index.for_stock('STOC4', YEAR + 1), [events[0]])
+        self.assertEqual(index.for_stock('HOLD3', YEAR), [])
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'eventos.json')
+            with open(filename, 'w') as file:
+                json.dump(
+                    {
+                        'STOC4': [
+                            {'data': '2023-03-01', 'tipo': 'desdobramento', 'fator': 2},
+                            {
+                                'data': '2023-06-01',
+                                'tipo': 'bonificacao',
+                                'fator': '0.1',
+                                'custo': 7.5,
+                            },
+                        ]
+                    },
+                    file,
+                )
+            index = load_events(filename)
+        self.assertEqual(
+            index.for_stock('STOC4', YEAR),
+            [
+                Event('STOC4', date(YEAR, 3, 1), SPLIT, Fraction(2)),
+                Event('STOC4', date(YEAR, 6, 1), BONUS, Fraction(1, 10), 7.5),
+            ],
+        )
+
+
+class TestYearWithEvents(TestCase):
+    def setUp(self):
+        self.operations = [
+            data.Buy('STOC4', 100, 10.0, date(YEAR, 1, 2)),
+            data.Sell('STOC4', 50, 6.0, date(YEAR, 3, 1)),
+            data.Buy('STOC4', 50, 4.0, date(YEAR, 4, 3)),
+        ]
+        self.events = [
+            # trades on the ex date are already adjusted
+            Event('STOC4', date(YEAR, 3, 1), SPLIT, Fraction(2)),
+            Event('STOC4', date(YEAR, 6, 1), BONUS, Fraction('0.5'), 3.0),
+        ]
+
+    def test_split_then_bonus(self):
+        year = data.YearOperations(
+            'STOC4', YEAR, {}, self.operations, events=self.events
+        )
+        year.calculate_loss_or_profit()
+        # 200 shares at 5.0 after the split, 50 of them sold at 6.0
+        self.assertAlmostEqual(year.months[2].profit, 50.0)
+        self.assertEqual(year.accumulated_quantity(month=5), 200)
+        # 100 bonus shares at 3.0
+        self.assertEqual(year.accumulated_quantity(), 300)
+        self.assertAlmostEqual(
+            year.accumulated_average(), (750.0 + 200.0 + 300.0) / 300
+        )
+        self.assertEqual(cross_check(year), [])
+
+    def test_incremental(self):
+        expected = data.YearOperations(
+            'STOC4', YEAR, {}, self.operations, events=self.events
+        )
+        expected.calculate_loss_or_profit()
+
+        index = EventIndex(self.events)
+        state = incremental.new_state(YEAR, {})
+        incremental.update(state, {'STOC4': self.operations[:2]}, index)
+        report = incremental.update(state, {'STOC4': self.operations[2:]}, index)
+        (year,) = report.stocks
+        self.assertEqual(expected.position(), year.position())
+        self.assertEqual(expected.operation_results, year.operation_results)
+
+    def test_position_without_trades(self):
+        index = EventIndex([Event('HOLD3', date(YEAR, 8, 1), SPLIT, Fraction(4))])
+        current = {'HOLD3': {'total': 100.0, 'preco-medio': 1.0, 'quantidade': 100}}
+        for engine in ENGINES:
+            report = Report(
+                current,
+                {YEAR: {'STOC4': self.operations}},
+                engine=engine,
+                events=index,
+            )
+            report.prepare()
+            self.assertEqual(
+                report.positions()['HOLD3'],
+                {'total': 100.0, 'preco-medio': 0.25, 'quantidade': 400},
+            )
+            self.assertEqual(report.totals.quantities(), [100, 400])
@@ -0,0 +1,320 @@
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from datetime import datetime
+from unittest import TestCase
+
+from openpyxl import Workbook
+
+from taxes import cache
+from taxes import data
+from taxes import file_handlers
+from taxes.report import Report
+
+TITLES = [
+    'Data do Negócio',
+    'Tipo de Movimentação',
+    'Mercado',
+    'Prazo/Vencimento',
+    'Instituição',
+    'Código de Negociação',
+    'Quantidade',
+    'Preço',
+    'Valor',
+]
+
+
+def write_b3_file(filename, rows):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'Negociação'
+    worksheet.append(TITLES)
+    for day, type_, code, quantity, price in rows:
+        worksheet.append(
+            [
+                day,
+                type_,
+                'Mercado à Vista',
+                '-',
+                'CORRETORA',
+                code,
+                quantity,
+                price,
+                round(quantity * price, 2),
+            ]
+        )
+    workbook.save(filename)
+
+
+def write_b3_csv(filename, lines):
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write(';'.join(TITLES) + '\n')
+        for line in lines:
+            file.write(line + '\n')
+
+
+class TestParseB3File(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'negociacao.xlsx')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse(self):
+        write_b3_file(
+            self.filename,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+                (datetime(2023, 2, 1), 'Venda', 'STOC4', 50, 2.0),
+                ('03/02/2023', 'Compra', 'ACAO3', 10, 10.0),
+            ],
+        )
+        parsed = file_handlers._parse_b3_file(self.filename)
+        self.assertEqual(list(parsed), [2023])
+        self.assertEqual(
+            parsed[2023],
+            {
+                'STOC4': [
+                    data.Buy('STOC4', 100, 1.5, date(2023, 1, 2)),
+                    data.Sell('STOC4', 50, 2.0, date(2023, 2, 1)),
+                ],
+                'ACAO3': [data.Buy('ACAO3', 10, 10.0, date(2023, 2, 3))],
+            },
+        )
+
+    def test_iter_is_lazy(self):
+        write_b3_file(
+            self.filename,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+                ('03/01/2023', 'Compra', 'STOC4', 100, 1.5),
+            ],
+        )
+        operations = file_handlers._iter_b3_file(self.filename)
+        self.assertEqual(
+            next(operations), data.Buy('STOC4', 100, 1.5, date(2023, 1, 2))
+        )
+        operations.close()
+
+    def test_parse_multiple_years(self):
+        write_b3_file(
+            self.filename,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+                ('02/01/2024', 'Compra', 'STOC4', 100, 1.5),
+            ],
+        )
+        with self.assertRaises(AssertionError):
+            file_handlers._parse_b3_file(self.filename)
+
+    def test_date_decoder(self):
+        decode = file_handlers._date_decoder()
+        self.assertEqual(decode('02/01/2023'), date(2023, 1, 2))
+        self.assertIs(decode('02/01/2023'), decode('02/01/2023'))
+        self.assertEqual(decode(datetime(2023, 2, 1)), date(2023, 2, 1))
+        # not zero padded, strptime still takes it
+        self.assertEqual(decode('2/1/2023'), date(2023, 1, 2))
+        with self.assertRaises(ValueError):
+            decode('2023-01-02')
+
+    def test_totals_reported_together(self):
+        csv = os.path.join(self.tmpdir.name, 'negociacao.csv')
+        write_b3_csv(
+            csv,
+            [
+                '02/01/2023;Compra;Mercado à Vista;-;CORRETORA;STOC4;10;1,50;15,00',
+                '03/01/2023;Compra;Mercado à Vista;-;CORRETORA;STOC4;10;1,50;25,00',
+                # off by a centavo, only a warning
+                '04/01/2023;Compra;Mercado à Vista;-;CORRETORA;STOC4;10;1,50;15,01',
+                '05/01/2023;Venda;Mercado à Vista;-;CORRETORA;STOC4;10;2,00;2,00',
+            ],
+        )
+        with self.assertLogs('taxes.file_handlers', 'WARNING') as logs:
+            with self.assertRaises(AssertionError) as raised:
+                file_handlers._parse_b3_file(csv)
+        self.assertEqual(len(logs.records), 3)
+        message = str(raised.exception)
+        self.assertIn('row 3: 15.0 != 25.0', message)
+        self.assertIn('row 5: 20.0 != 2.0', message)
+        self.assertNotIn('row 4', message)
+        path = cache.cache_path(csv, file_handlers.PARSER_VERSION)
+        self.assertFalse(os.path.exists(path))
+
+
+class TestLoadB3Files(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_group_by_year(self):
+        first = os.path.join(self.tmpdir.name, 'first.xlsx')
+        second = os.path.join(self.tmpdir.name, 'second.xlsx')
+        write_b3_file(
+            first,
+            [
+                ('02/01/2022', 'Compra', 'STOC4', 100, 1.5),
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+            ],
+        )
+        write_b3_file(second, [('02/02/2023', 'Venda', 'STOC4', 100, 2.0)])
+        years = file_handlers.load_b3_files([first, second])
+        self.assertEqual(sorted(years), [2022, 2023])
+        self.assertEqual(len(years[2022]['STOC4']), 1)
+        self.assertEqual(
+            years[2023]['STOC4'],
+            [
+                data.Buy('STOC4', 100, 1.5, date(2023, 1, 2)),
+                data.Sell('STOC4', 100, 2.0, date(2023, 2, 2)),
+            ],
+        )
+
+    def test_row_order_does_not_change_results(self):
+        rows = [
+            ('02/01/2023', 'Compra', 'STOC4', 100, 1.1),
+            ('05/01/2023', 'Compra', 'STOC4', 300, 1.3),
+            ('09/01/2023', 'Compra', 'STOC4', 700, 1.7),
+            ('03/02/2023', 'Venda', 'STOC4', 30, 2.1),
+            ('06/02/2023', 'Venda', 'STOC4', 70, 2.3),
+            ('10/02/2023', 'Venda', 'STOC4', 110, 2.9),
+        ]
+        in_order = os.path.join(self.tmpdir.name, 'in_order.xlsx')
+        shuffled = os.path.join(self.tmpdir.name, 'shuffled.xlsx')
+        write_b3_file(in_order, rows)
+        write_b3_file(shuffled, [rows[i] for i in (5, 1, 3, 0, 4, 2)])
+
+        reports = []
+        for filename in (in_order, shuffled):
+            b3input = file_handlers.load_b3_files([filename], cache=False)
+            report = Report({}, b3input)
+            report.prepare()
+            reports.append(report)
+        # sorted when loaded, the sums are taken in the same order
+        self.assertEqual(reports[0].taxes, reports[1].taxes)
+        self.assertEqual(reports[0].positions(), reports[1].positions())
+
+    def test_merge_in_date_order(self):
+        first = os.path.join(self.tmpdir.name, 'first.xlsx')
+        second = os.path.join(self.tmpdir.name, 'second.xlsx')
+        write_b3_file(
+            first,
+            [
+                ('10/02/2023', 'Venda', 'STOC4', 10, 2.0),
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+            ],
+        )
+        write_b3_file(second, [('20/01/2023', 'Compra', 'STOC4', 100, 1.0)])
+        years = file_handlers.load_b3_files([first, second], cache=False)
+        self.assertEqual(
+            [operation.date.day for operation in years[2023]['STOC4']], [2, 20, 10]
+        )
+
+
+class TestParseCache(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'negociacao.xlsx')
+        write_b3_file(
+            self.filename,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+                ('03/01/2023', 'Compra', 'ACAO3', 10, 10.25),
+                ('02/02/2023', 'Venda', 'STOC4', 100, 2.0),
+            ],
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache_is_written(self):
+        path = cache.cache_path(self.filename, file_handlers.PARSER_VERSION)
+        self.assertFalse(os.path.exists(path))
+        parsed = file_handlers._parse_b3_file(self.filename)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(file_handlers._parse_b3_file(self.filename), parsed)
+
+    def test_no_cache(self):
+        path = cache.cache_path(self.filename, file_handlers.PARSER_VERSION)
+        file_handlers._parse_b3_file(self.filename, cache=False)
+        self.assertFalse(os.path.exists(path))
+
+    def test_key_changes_with_content(self):
+        path = cache.cache_path(self.filename, file_handlers.PARSER_VERSION)
+        file_handlers._parse_b3_file(self.filename)
+        write_b3_file(self.filename, [('02/01/2023', 'Compra', 'STOC4', 1, 1.5)])
+        self.assertNotEqual(
+            path, cache.cache_path(self.filename, file_handlers.PARSER_VERSION)
+        )
+        parsed = file_handlers._parse_b3_file(self.filename)
+        self.assertEqual(parsed[2023]['STOC4'][0].quantity, 1)
+
+    def test_key_changes_with_version(self):
+        self.assertNotEqual(
+            cache.cache_path(self.filename, 1), cache.cache_path(self.filename, 2)
+        )
+
+    def test_cached_run_skips_openpyxl(self):
+        file_handlers._parse_b3_file(self.filename)
+        script = (
+            'import sys\n'
+            'from taxes.file_handlers import _parse_b3_file\n'
+            f'assert _parse_b3_file({self.filename!r})[2023]\n'
+            'assert "openpyxl" not in sys.modules\n'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, '-c', script], check=True, cwd=root)
+
+
+class TestParseB3Csv(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_as_xlsx(self):
+        xlsx = os.path.join(self.tmpdir.name, 'negociacao.xlsx')
+        csv = os.path.join(self.tmpdir.name, 'negociacao.csv')
+        write_b3_file(
+            xlsx,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 1000, 1.5),
+                ('02/02/2023', 'Venda', 'STOC4', 100, 2.33),
+            ],
+        )
+        write_b3_csv(
+            csv,
+            [
+                '02/01/2023;Compra;Mercado à Vista;-;CORRETORA;STOC4;1.000;1,50;'
+                '"R$ 1.500,00"',
+                '02/02/2023;Venda;Mercado à Vista;-;CORRETORA;STOC4;100;2,33;233,00',
+                '',
+            ],
+        )
+        self.assertEqual(
+            file_handlers._parse_b3_file(csv, cache=False),
+            file_handlers._parse_b3_file(xlsx, cache=False),
+        )
+
+    def test_comma_separated(self):
+        csv = os.path.join(self.tmpdir.name, 'negociacao.csv')
+        with open(csv, 'w', encoding='utf-8') as file:
+            file.write(','.join(TITLES) + '\n')
+            file.write(
+                '02/01/2023,Compra,Mercado à Vista,-,CORRETORA,STOC4,10,1.5,15.0\n'
+            )
+        self.assertEqual(
+            file_handlers._parse_b3_file(csv, cache=False),
+            {2023: {'STOC4': [data.Buy('STOC4', 10, 1.5, date(2023, 1, 2))]}},
+        )
+
+    def test_invalid_titles(self):
+        csv = os.path.join(self.tmpdir.name, 'negociacao.csv')
+        with open(csv, 'w', encoding='utf-8') as file:
+            file.write(';'.join(TITLES).replace('Preço', 'Preco') + '\n')
+        with self.assertRaises(AssertionError):
+            file_handlers._parse_b3_file(csv, cache=False)
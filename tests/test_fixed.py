@@ -0,0 +1,180 @@
+import random
+from datetime import date
+from unittest import TestCase
+
+from taxes import data
+from taxes.fixed import SCALE
+from taxes.fixed import FixedLedger
+from taxes.fixed import _divide
+from taxes.fixed import cross_check
+from taxes.fixed import to_fixed
+from taxes.report import Report
+from taxes.report import run_years
+
+YEAR = 2023
+
+
+class TestFixedPoint(TestCase):
+    def test_to_fixed(self):
+        self.assertEqual(to_fixed(0.1), 100000)
+        self.assertEqual(to_fixed(1.234567), 1234567)
+        self.assertEqual(to_fixed(19999.99), 19999990000)
+
+    def test_divide_rounds_half_to_even(self):
+        self.assertEqual(_divide(5, 2), 2)
+        self.assertEqual(_divide(7, 2), 4)
+        self.assertEqual(_divide(10, 3), 3)
+        self.assertEqual(_divide(11, 3), 4)
+
+    def test_selling_everything_leaves_nothing(self):
+        ledger = FixedLedger(
+            0.0,
+            0,
+            [
+                data.Buy('STOC4', 3, 10.01, date(YEAR, 1, 2)),
+                data.Buy('STOC4', 7, 9.97, date(YEAR, 1, 3)),
+                data.Sell('STOC4', 1, 11.0, date(YEAR, 2, 1)),
+                data.Sell('STOC4', 9, 11.0, date(YEAR, 3, 1)),
+            ],
+        )
+        self.assertEqual(ledger.quantity, 0)
+        self.assertEqual(ledger.total, 0)
+        # everything bought was sold at cost
+        self.assertEqual(sum(ledger.costs), (3 * 1001 + 7 * 997) * SCALE // 100)
+        self.assertEqual(sum(ledger.results), 110 * SCALE - sum(ledger.costs))
+
+    def test_invalid_operation(self):
+        with self.assertRaises(TypeError):
+            FixedLedger(0.0, 0, [data.Operation('STOC4', 1, 1.0, date(YEAR, 1, 2))])
+
+
+class TestCrossCheck(TestCase):
+    def random_operations(self, seed):
+        randomizer = random.Random(seed)
+        operations = []
+        quantity = 0
+        days = range(date(YEAR, 1, 1).toordinal(), date(YEAR, 12, 31).toordinal())
+        for ordinal in sorted(randomizer.sample(days, 60)):
+            price = round(randomizer.uniform(1, 100), 2)
+            if quantity and randomizer.random() < 0.4:
+                sold = randomizer.randint(1, quantity)
+                quantity -= sold
+                operations.append(
+                    data.Sell('STOC4', sold, price, date.fromordinal(ordinal))
+                )
+            else:
+                bought = randomizer.randint(1, 500)
+                quantity += bought
+                operations.append(
+                    data.Buy('STOC4', bought, price, date.fromordinal(ordinal))
+                )
+        return operations
+
+    def test_float_engine_agrees(self):
+        for seed in range(20):
+            year = data.YearOperations(
+                'STOC4',
+                YEAR,
+                {'total': 1234.56, 'quantidade': 100},
+                self.random_operations(seed),
+            )
+            year.calculate_loss_or_profit()
+            self.assertEqual(cross_check(year), [])
+
+    def test_mismatch(self):
+        year = data.YearOperations(
+            'STOC4',
+            YEAR,
+            {},
+            [
+                data.Buy('STOC4', 10, 10.0, date(YEAR, 1, 2)),
+                data.Sell('STOC4', 5, 12.0, date(YEAR, 2, 1)),
+            ],
+        )
+        year.calculate_loss_or_profit()
+        year.months[1].profit += 0.5
+        (mismatch,) = cross_check(year)
+        self.assertIn('STOC4 February', mismatch)
+
+
+class TestFixedEngine(TestCase):
+    def setUp(self):
+        self.current = {
+            'HOLD3': {'total': 333.33, 'preco-medio': 3.3333, 'quantidade': 100},
+        }
+        self.b3input = {
+            YEAR: {
+                'STOC4': [
+                    data.Buy('STOC4', 100, 12.37, date(YEAR, 1, 2)),
+                    data.Sell('STOC4', 50, 15.01, date(YEAR, 2, 1)),
+                    data.Buy('STOC4', 300, 11.11, date(YEAR, 2, 10)),
+                    data.Sell('STOC4', 350, 13.0, date(YEAR, 5, 1)),
+                    data.Buy('STOC4', 10, 10.0, date(YEAR, 6, 1)),
+                    data.Sell('STOC4', 10, 11.0, date(YEAR, 6, 1)),
+                ],
+            }
+        }
+
+    def prepare(self, engine):
+        report = Report(self.current, self.b3input, engine=engine, cross_check=True)
+        report.prepare()
+        return report
+
+    def test_same_results(self):
+        python = self.prepare('python')
+        fixed = self.prepare('fixed')
+        self.assertEqual(python.mismatches, [])
+        self.assertEqual(fixed.mismatches, [])
+        for name in (
+            'sold_by_month',
+            'results_by_month',
+            'day_trade_results_by_month',
+            'averages',
+        ):
+            for expected, value in zip(
+                getattr(python.totals, name)(), getattr(fixed.totals, name)()
+            ):
+                self.assertAlmostEqual(expected, value, places=6)
+        self.assertEqual(python.totals.quantities(), fixed.totals.quantities())
+        for expected, tax in zip(python.taxes, fixed.taxes):
+            for name in ('sold', 'result', 'exempt', 'taxable', 'accumulated_loss'):
+                self.assertAlmostEqual(
+                    getattr(expected, name), getattr(tax, name), places=6
+                )
+            self.assertEqual(expected.tax_due, tax.tax_due)
+
+
+class TestFixedPositions(TestCase):
+    def setUp(self):
+        self.b3input = {
+            2023: {
+                'STOC4': [
+                    data.Buy('STOC4', 1, 1.0, date(2023, 1, 2)),
+                    data.Buy('STOC4', 2, 1.01, date(2023, 1, 3)),
+                    data.Sell('STOC4', 1, 2.0, date(2023, 2, 1)),
+                ]
+            },
+            2024: {'STOC4': [data.Sell('STOC4', 1, 2.0, date(2024, 2, 1))]},
+        }
+
+    def test_positions_from_the_ledger(self):
+        python = Report({}, {2023: self.b3input[2023]})
+        python.prepare()
+        fixed = Report({}, {2023: self.b3input[2023]}, engine='fixed')
+        fixed.prepare()
+        # the cost of the sold share is rounded to the millionth of real
+        self.assertEqual(python.position('STOC4')['preco-medio'], 1.006666667)
+        self.assertEqual(
+            fixed.position('STOC4'),
+            {'total': 2.01, 'preco-medio': 1.0066665, 'quantidade': 2},
+        )
+        self.assertEqual(fixed.positions(), {'STOC4': fixed.position('STOC4')})
+
+    def test_carried_to_next_year(self):
+        first, second = run_years({}, self.b3input, engine='fixed')
+        self.assertEqual(second.current, first.positions())
+        # the next year opens from the saved total, R$ 2,01 for 2 shares
+        self.assertEqual(
+            second.position('STOC4'),
+            {'total': 1.0, 'preco-medio': 1.005, 'quantidade': 1},
+        )
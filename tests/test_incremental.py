@@ -0,0 +1,236 @@
+import json
+import os
+import random
+import tempfile
+from datetime import date
+from unittest import TestCase
+
+from taxes import data
+from taxes import incremental
+from taxes import metrics
+from taxes.fixed import FixedLedger
+
+YEAR = 2023
+INITIAL = {'STOC4': {'total': 1234.56, 'preco-medio': 12.3456, 'quantidade': 100}}
+
+
+def random_operations(seed, stocks=('STOC4', 'ACAO3')):
+    randomizer = random.Random(seed)
+    operations = {stock: [] for stock in stocks}
+    quantities = {'STOC4': 100, 'ACAO3': 0}
+    days = range(date(YEAR, 1, 2).toordinal(), date(YEAR, 12, 29).toordinal(), 3)
+    for ordinal in days:
+        stock = randomizer.choice(stocks)
+        # a few trades a day, sometimes buying and selling on the same day
+        for _ in range(randomizer.randint(1, 3)):
+            price = round(randomizer.uniform(5, 50), 2)
+            if quantities[stock] and randomizer.random() < 0.4:
+                quantity = randomizer.randint(1, quantities[stock])
+                quantities[stock] -= quantity
+                operation = data.Sell(stock, quantity, price, date.fromordinal(ordinal))
+            else:
+                quantity = randomizer.randint(1, 300)
+                quantities[stock] += quantity
+                operation = data.Buy(stock, quantity, price, date.fromordinal(ordinal))
+            operations[stock].append(operation)
+    return operations
+
+
+def until(operations, last_date):
+    return {
+        stock: [
+            operation for operation in stock_operations if operation.date <= last_date
+        ]
+        for stock, stock_operations in operations.items()
+    }
+
+
+def since(operations, first_date):
+    return {
+        stock: [
+            operation for operation in stock_operations if operation.date >= first_date
+        ]
+        for stock, stock_operations in operations.items()
+    }
+
+
+class TestIncremental(TestCase):
+    def full_year(self, operations):
+        years = {}
+        for stock in set(INITIAL) | set(operations):
+            year = data.YearOperations(
+                stock, YEAR, INITIAL.get(stock, {}), operations.get(stock, [])
+            )
+            year.calculate_loss_or_profit()
+            years[stock] = year
+        return years
+
+    def assertSameYear(self, expected, year):
+        self.assertEqual(expected.position(), year.position())
+        self.assertEqual(expected.operation_results, year.operation_results)
+        self.assertEqual(expected.day_trade_results, year.day_trade_results)
+        self.assertEqual(expected.ledger.costs, year.ledger.costs)
+        self.assertEqual(expected.ledger.average, year.ledger.average)
+        for expected_month, month in zip(expected.months, year.months):
+            self.assertEqual(expected_month.sell.total, month.sell.total)
+            self.assertEqual(expected_month.buy.total, month.buy.total)
+
+    def test_same_results_as_whole_year(self):
+        for seed in range(5):
+            operations = random_operations(seed)
+            state = incremental.new_state(YEAR, INITIAL)
+            # the second export starts on the last day of the first one
+            incremental.update(state, until(operations, date(YEAR, 4, 9)))
+            incremental.update(
+                state, until(since(operations, date(YEAR, 4, 9)), date(YEAR, 9, 3))
+            )
+            # saved and loaded in between
+            state = json.loads(json.dumps(state))
+            report = incremental.update(state, since(operations, date(YEAR, 9, 4)))
+
+            expected = self.full_year(operations)
+            years = {year.stock: year for year in report.stocks}
+            self.assertEqual(set(expected), set(years))
+            for stock, year in years.items():
+                self.assertSameYear(expected[stock], year)
+            self.assertEqual(
+                sum(len(stock_operations) for stock_operations in operations.values()),
+                sum(details['trades'] for details in state['stocks'].values()),
+            )
+
+    def test_replays_only_the_last_day(self):
+        operations = {
+            'STOC4': [
+                data.Buy('STOC4', 10, 10.0, date(YEAR, 1, 2)),
+                data.Buy('STOC4', 10, 11.0, date(YEAR, 1, 3)),
+                data.Sell('STOC4', 5, 12.0, date(YEAR, 1, 3)),
+            ]
+        }
+        state = incremental.new_state(YEAR, INITIAL)
+        incremental.update(state, operations)
+        self.assertEqual(state['stocks']['STOC4']['trades'], 3)
+        self.assertEqual(len(state['stocks']['STOC4']['last_day']), 2)
+
+        metrics.enable()
+        try:
+            report = incremental.update(
+                state, {'STOC4': [data.Sell('STOC4', 5, 13.0, date(YEAR, 2, 1))]}
+            )
+            replayed = metrics.summary()['counters']['incremental.replayed']
+        finally:
+            metrics.disable()
+        # the saved day and the new trade
+        self.assertEqual(replayed, 3)
+        self.assertEqual(state['stocks']['STOC4']['trades'], 4)
+        (year,) = report.stocks
+        self.assertEqual(year.position()['quantidade'], 110)
+
+    def test_restores_stocks_without_trades(self):
+        operations = random_operations(2)
+        state = incremental.new_state(YEAR, INITIAL)
+        incremental.update(state, until(operations, date(YEAR, 6, 30)))
+        state = json.loads(json.dumps(state))
+
+        # only ACAO3 trades after June
+        later = since(operations, date(YEAR, 7, 1))
+        later['STOC4'] = []
+        saved = len(state['stocks']['ACAO3']['last_day'])
+        metrics.enable()
+        try:
+            report = incremental.update(state, later)
+            counters = metrics.summary()['counters']
+        finally:
+            metrics.disable()
+        self.assertEqual(counters['incremental.restored'], 1)
+        self.assertEqual(counters['incremental.replayed'], len(later['ACAO3']) + saved)
+
+        expected = self.full_year(
+            {
+                'STOC4': until(operations, date(YEAR, 6, 30))['STOC4'],
+                'ACAO3': operations['ACAO3'],
+            }
+        )
+        for year in report.stocks:
+            self.assertSameYear(expected[year.stock], year)
+        # the history before the state is not kept
+        with self.assertRaises(AssertionError):
+            FixedLedger.of(report.stock('STOC4'))
+
+    def test_repeated_export(self):
+        operations = random_operations(1)
+        state = incremental.new_state(YEAR, INITIAL)
+        incremental.update(state, operations)
+        report = incremental.update(state, operations)
+        expected = self.full_year(operations)
+        for year in report.stocks:
+            self.assertSameYear(expected[year.stock], year)
+
+
+class TestRunYears(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_state_files(self):
+        b3input = {
+            YEAR: {'STOC4': [data.Sell('STOC4', 50, 10.0, date(YEAR, 3, 1))]},
+        }
+        (report,) = incremental.run_years(INITIAL, b3input, self.tmpdir.name)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmpdir.name, f'estado.{YEAR}.json'))
+        )
+        loss = report.taxes[-1].accumulated_loss
+        self.assertLess(loss, 0.0)
+
+        # the next year opens with the saved closing of this one
+        b3input = {
+            YEAR + 1: {'STOC4': [data.Sell('STOC4', 10, 20.0, date(YEAR + 1, 3, 1))]},
+        }
+        (report,) = incremental.run_years({}, b3input, self.tmpdir.name)
+        self.assertEqual(report.positions()['STOC4']['quantidade'], 40)
+        # the loss is carried over, small sales are exempt
+        self.assertGreater(report.taxes[2].exempt, 0.0)
+        self.assertEqual(report.taxes[-1].accumulated_loss, loss)
+
+    def test_earlier_year_changed(self):
+        first = [
+            data.Buy('STOC4', 100, 10.0, date(YEAR, 3, 1)),
+            data.Sell('STOC4', 50, 12.0, date(YEAR, 6, 1)),
+        ]
+        late = [data.Buy('STOC4', 50, 20.0, date(YEAR, 12, 20))]
+        next_year = [data.Sell('STOC4', 50, 20.0, date(YEAR + 1, 2, 1))]
+        list(
+            incremental.run_years(
+                {},
+                {YEAR: {'STOC4': first}, YEAR + 1: {'STOC4': next_year}},
+                self.tmpdir.name,
+            )
+        )
+
+        b3input = {YEAR: {'STOC4': first + late}, YEAR + 1: {'STOC4': next_year}}
+        reports = list(incremental.run_years({}, b3input, self.tmpdir.name))
+        with tempfile.TemporaryDirectory() as directory:
+            expected = list(incremental.run_years({}, b3input, directory))
+        self.assertEqual(
+            reports[0].positions(),
+            {'STOC4': {'total': 1500.0, 'preco-medio': 15.0, 'quantidade': 100}},
+        )
+        self.assertEqual(
+            reports[1].positions(),
+            {'STOC4': {'total': 750.0, 'preco-medio': 15.0, 'quantidade': 50}},
+        )
+        for report, expected_report in zip(reports, expected):
+            self.assertEqual(report.positions(), expected_report.positions())
+            self.assertEqual(report.taxes, expected_report.taxes)
+
+        # the next year is stale when only the earlier one is updated
+        changed = {YEAR: {'STOC4': [data.Buy('STOC4', 10, 30.0, date(YEAR, 12, 28))]}}
+        with self.assertLogs('taxes.incremental', 'WARNING'):
+            list(incremental.run_years({}, changed, self.tmpdir.name))
+
+    def test_other_version(self):
+        path = incremental.state_path(self.tmpdir.name, YEAR)
+        incremental.save_state(path, {'version': 0})
+        self.assertIsNone(incremental.load_state(path))
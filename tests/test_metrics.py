@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from taxes import metrics
+
+
+class TestMetrics(TestCase):
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled(self):
+        metrics.count('rows')
+        with metrics.timer('phase'):
+            pass
+        self.assertEqual(metrics.summary(), {'counters': {}, 'timers': {}})
+
+    def test_counters(self):
+        metrics.enable()
+        metrics.count('rows')
+        metrics.count('rows', 10)
+        self.assertEqual(metrics.summary()['counters'], {'rows': 11})
+
+    def test_timers(self):
+        metrics.enable()
+        with metrics.timer('phase'):
+            pass
+        with metrics.timer('phase'):
+            pass
+        self.assertEqual(metrics.summary()['timers']['phase']['calls'], 2)
+
+    def test_timed(self):
+        @metrics.timed('function')
+        def function(value):
+            return value * 2
+
+        self.assertEqual(function(2), 4)
+        self.assertFalse(metrics.summary()['timers'])
+        metrics.enable()
+        self.assertEqual(function(3), 6)
+        self.assertEqual(metrics.summary()['timers']['function']['calls'], 1)
+
+    def test_enable_resets(self):
+        metrics.enable()
+        metrics.count('rows')
+        metrics.enable()
+        self.assertFalse(metrics.summary()['counters'])
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from taxes.file_handlers import load_b3_files
+from taxes.pipeline import run
+from taxes.report import run_years
+from tests.test_file_handlers import write_b3_file
+
+INITIAL = {'HOLD3': {'total': 10.0, 'preco-medio': 1.0, 'quantidade': 10}}
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.exports = []
+        rows = (
+            [
+                ('02/01/2022', 'Compra', 'STOC4', 100, 1.5),
+                ('02/02/2022', 'Venda', 'STOC4', 50, 1.0),
+            ],
+            [
+                ('02/06/2022', 'Compra', 'STOC4', 10, 2.5),
+                ('02/06/2022', 'Compra', 'ACAO3', 10, 20.0),
+            ],
+            [
+                ('02/01/2023', 'Venda', 'STOC4', 60, 3.0),
+                ('02/01/2023', 'Venda', 'HOLD3', 10, 2.0),
+            ],
+        )
+        for number, export_rows in enumerate(rows):
+            filename = os.path.join(self.tmpdir.name, f'negociacao-{number}.xlsx')
+            write_b3_file(filename, export_rows)
+            self.exports.append(filename)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_reports(self):
+        written = []
+        reports = run(
+            INITIAL,
+            self.exports,
+            write=lambda report: written.append(report.year),
+            workers=2,
+            cache=False,
+        )
+        expected = list(run_years(INITIAL, load_b3_files(self.exports, cache=False)))
+        self.assertEqual([report.year for report in reports], [2022, 2023])
+        self.assertEqual(written, [2022, 2023])
+        for report, expected_report in zip(reports, expected):
+            self.assertEqual(report.positions(), expected_report.positions())
+            self.assertEqual(report.taxes, expected_report.taxes)
+
+    def test_out_of_order(self):
+        with self.assertRaises(ValueError):
+            run(INITIAL, self.exports[::-1], workers=1, cache=False)
+
+    def test_parse_error(self):
+        broken = os.path.join(self.tmpdir.name, 'quebrado.xlsx')
+        with open(broken, 'w') as file:
+            file.write('not a workbook')
+        # the error of the worker parsing the export
+        with self.assertRaises(zipfile.BadZipFile):
+            run(INITIAL, [self.exports[0], broken], workers=1, cache=False)
+
+    def test_nothing_written_after_a_parse_error(self):
+        broken = os.path.join(self.tmpdir.name, 'quebrado.xlsx')
+        with open(broken, 'w') as file:
+            file.write('not a workbook')
+        written = []
+        with self.assertRaises(zipfile.BadZipFile):
+            run(
+                INITIAL,
+                self.exports + [broken],
+                write=lambda report: written.append(report.year),
+                workers=1,
+                cache=False,
+            )
+        # 2022 was complete, 2023 could go on in the broken export
+        self.assertEqual(written, [2022])
@@ -0,0 +1,68 @@
+import os
+import pstats
+import tempfile
+from unittest import TestCase
+
+from taxes import profiling
+
+
+def work(size):
+    return sorted(str(number) for number in range(size))
+
+
+class TestProfiling(TestCase):
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled(self):
+        phases = profiling.phases()
+        with profiling.phase('parse'):
+            work(10)
+        self.assertEqual(profiling.phases(), phases)
+
+    def test_phases(self):
+        profiled = profiling.profiled('sort')(work)
+        profiling.enable()
+        with profiling.phase('load'):
+            work(10)
+        profiled(100_000)
+        profiled(10)
+        load, sort = profiling.phases()
+        self.assertEqual((load.name, load.calls), ('load', 1))
+        self.assertEqual((sort.name, sort.calls), ('sort', 2))
+        self.assertGreater(sort.wall, 0)
+        self.assertGreater(sort.cpu, 0)
+        # the strings of the largest call
+        self.assertGreater(sort.peak_memory, 100_000 * 40)
+        lines = profiling.table()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].startswith('sort'))
+
+    def test_nested(self):
+        profiling.enable()
+        with profiling.phase('report'):
+            with profiling.phase('prepare'):
+                work(10)
+        self.assertEqual([phase.name for phase in profiling.phases()], ['report'])
+
+    def test_save(self):
+        profiling.enable()
+        with profiling.phase('sort'):
+            work(10_000)
+        profiling.disable()
+        with tempfile.TemporaryDirectory() as directory:
+            profiling.save(directory)
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                ['profile.folded', 'profile.pstats', 'sort.pstats'],
+            )
+            stats = pstats.Stats(os.path.join(directory, 'sort.pstats'))
+            self.assertIn('work', {function for _, _, function in stats.stats})
+            with open(os.path.join(directory, 'profile.folded')) as file:
+                lines = file.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            frames, microseconds = line.rsplit(' ', 1)
+            self.assertTrue(frames.startswith('sort;'))
+            self.assertGreater(int(microseconds), 0)
+        self.assertTrue(any('work (test_profiling.py' in line for line in lines))
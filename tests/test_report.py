@@ -0,0 +1,229 @@
+from datetime import date
+from unittest import TestCase
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from taxes import data
+from taxes.report import Portfolio
+from taxes.report import Report
+from taxes.report import run_years
+
+
+class TestReportPositions(TestCase):
+    def test_positions(self):
+        report = Report(
+            {'HOLD3': {'total': 100.0, 'preco-medio': 1.0, 'quantidade': 100}},
+            {
+                2023: {
+                    'STOC4': [
+                        data.Buy('STOC4', 100, 1.5, date(2023, 1, 2)),
+                        data.Sell('STOC4', 100, 2.0, date(2023, 2, 1)),
+                    ],
+                    'ACAO3': [data.Buy('ACAO3', 3, 10.0, date(2023, 3, 1))],
+                }
+            },
+        )
+        report.prepare()
+        self.assertEqual(
+            report.positions(),
+            {
+                'ACAO3': {'total': 30.0, 'preco-medio': 10.0, 'quantidade': 3},
+                'HOLD3': {'total': 100.0, 'preco-medio': 1.0, 'quantidade': 100},
+            },
+        )
+
+
+class TestRunYears(TestCase):
+    def test_chained_positions(self):
+        b3input = {
+            2024: {'STOC4': [data.Sell('STOC4', 100, 3.0, date(2024, 5, 2))]},
+            2022: {'STOC4': [data.Buy('STOC4', 100, 1.0, date(2022, 1, 3))]},
+            2023: {'STOC4': [data.Buy('STOC4', 100, 2.0, date(2023, 1, 3))]},
+        }
+        reports = list(run_years({}, b3input))
+        self.assertEqual([report.year for report in reports], [2022, 2023, 2024])
+        self.assertEqual(reports[1].current['STOC4']['quantidade'], 100)
+        self.assertEqual(reports[2].current['STOC4']['quantidade'], 200)
+        self.assertEqual(reports[2].current['STOC4']['preco-medio'], 1.5)
+        self.assertEqual(reports[2].stocks[0].profit, 300.0 - 150.0)
+        # exempt is decided for the whole portfolio, by month
+        self.assertEqual(reports[2].taxes[4].exempt, 300.0 - 150.0)
+        self.assertEqual(
+            reports[2].positions(),
+            {'STOC4': {'total': 150.0, 'preco-medio': 1.5, 'quantidade': 100}},
+        )
+
+    def test_loss_carried_to_next_year(self):
+        b3input = {
+            2022: {
+                'STOC4': [
+                    data.Buy('STOC4', 100, 10.0, date(2022, 1, 3)),
+                    data.Sell('STOC4', 100, 5.0, date(2022, 2, 3)),
+                ]
+            },
+            2023: {
+                'STOC4': [
+                    data.Buy('STOC4', 3000, 10.0, date(2023, 1, 3)),
+                    data.Sell('STOC4', 3000, 11.0, date(2023, 2, 3)),
+                ]
+            },
+        }
+        reports = list(run_years({}, b3input))
+        self.assertEqual(reports[0].taxes[-1].accumulated_loss, -500.0)
+        self.assertEqual(reports[1].taxes[1].compensated, 500.0)
+        self.assertEqual(reports[1].taxes[1].taxable, 2500.0)
+
+
+class TestParallelPrepare(TestCase):
+    def setUp(self):
+        self.current = {
+            'HOLD3': {'total': 100.0, 'preco-medio': 1.0, 'quantidade': 100}
+        }
+        self.b3input = {
+            2023: {
+                f'STO{number}4': [
+                    data.Buy(f'STO{number}4', 100 + number, 1.5, date(2023, 1, 2)),
+                    data.Sell(f'STO{number}4', 50, 1.0 + number, date(2023, 2, 1)),
+                ]
+                for number in range(10)
+            }
+        }
+
+    def prepare(self, workers):
+        report = Report(self.current, self.b3input, workers=workers)
+        report.prepare()
+        return report
+
+    def test_same_as_serial(self):
+        serial = self.prepare(None)
+        parallel = self.prepare(2)
+        self.assertEqual(
+            [year.stock for year in serial.stocks],
+            [year.stock for year in parallel.stocks],
+        )
+        self.assertEqual(serial.positions(), parallel.positions())
+        self.assertEqual(
+            serial.totals.results_by_month(), parallel.totals.results_by_month()
+        )
+
+
+class TestPortfolioExemption(TestCase):
+    def test_sales_added_across_stocks(self):
+        report = Report(
+            {},
+            {
+                2023: {
+                    stock: [
+                        data.Buy(stock, 1000, 10.0, date(2023, 1, 2)),
+                        data.Sell(stock, 1000, 15.0, date(2023, 2, 1)),
+                    ]
+                    for stock in ('STOC4', 'ACAO3')
+                }
+            },
+        )
+        report.prepare()
+        february = report.taxes[1]
+        # each stock sold R$ 15.000,00, together they are over the limit
+        self.assertEqual(february.sold, 30000.0)
+        self.assertEqual(february.exempt, 0.0)
+        self.assertEqual(february.taxable, 10000.0)
+        self.assertEqual(february.tax_due, 1500.0)
+        self.assertEqual(sum(tax.exempt for tax in report.taxes), 0.0)
+
+
+class TestDayTrade(TestCase):
+    def test_day_trade_taxed_apart(self):
+        report = Report(
+            {},
+            {
+                2023: {
+                    'STOC4': [
+                        data.Buy('STOC4', 100, 10.0, date(2023, 1, 2)),
+                        data.Sell('STOC4', 100, 12.0, date(2023, 1, 2)),
+                        data.Buy('STOC4', 100, 10.0, date(2023, 1, 3)),
+                        data.Sell('STOC4', 100, 9.0, date(2023, 2, 1)),
+                    ]
+                }
+            },
+        )
+        report.prepare()
+        self.assertEqual(report.day_trade_taxes[0].result, 200.0)
+        self.assertEqual(report.day_trade_taxes[0].tax_due, 40.0)
+        # the common loss is not used against the day trade gain
+        self.assertEqual(report.taxes[1].result, -100.0)
+        self.assertEqual(report.taxes[0].sold, 0.0)
+        self.assertEqual(report.taxes[-1].accumulated_loss, -100.0)
+
+
+class TestPortfolio(TestCase):
+    def setUp(self):
+        self.current = {
+            'HOLD3': {'total': 100.0, 'preco-medio': 1.0, 'quantidade': 100}
+        }
+        self.b3input = {
+            2023: {
+                'STOC4': [
+                    data.Buy('STOC4', 1000, 10.0, date(2023, 1, 2)),
+                    data.Sell('STOC4', 1000, 15.0, date(2023, 2, 1)),
+                ],
+                'ACAO3': [
+                    data.Buy('ACAO3', 1000, 10.0, date(2023, 1, 2)),
+                    data.Sell('ACAO3', 300, 12.0, date(2023, 2, 1)),
+                ],
+            }
+        }
+        # ACAO3 sells it all, together February is over the exemption limit
+        self.what_if = [
+            data.Buy('ACAO3', 1000, 10.0, date(2023, 1, 2)),
+            data.Sell('ACAO3', 1000, 12.33, date(2023, 2, 1)),
+        ]
+
+    def test_lookup(self):
+        report = Report(self.current, self.b3input)
+        report.prepare()
+        self.assertEqual(list(report.stocks.tickers()), ['STOC4', 'ACAO3', 'HOLD3'])
+        self.assertIs(report.stock('ACAO3'), report.stocks[1])
+        self.assertEqual(
+            report.position('ACAO3'),
+            {'total': 7000.0, 'preco-medio': 10.0, 'quantidade': 700},
+        )
+        with self.assertRaises(KeyError):
+            report.stock('NADA3')
+        with self.assertRaises(AssertionError):
+            report.stocks.append(report.stock('HOLD3'))
+        self.assertEqual(len(Portfolio(report.stocks)), 3)
+
+    def test_what_if(self):
+        engines = ('python', 'fixed', 'numpy') if numpy else ('python', 'fixed')
+        for engine in engines:
+            report = Report(self.current, self.b3input, engine=engine)
+            report.prepare()
+            self.assertEqual(report.taxes[1].tax_due, 0.0)
+            untouched = report.stock('STOC4')
+
+            previous = report.replace(report.prepare_stock('ACAO3', self.what_if))
+            # as if the year had been reported with these operations
+            b3input = {2023: dict(self.b3input[2023], ACAO3=self.what_if)}
+            expected = Report(self.current, b3input, engine=engine)
+            expected.prepare()
+            self.assertIs(report.stock('STOC4'), untouched)
+            self.assertEqual(report.taxes, expected.taxes)
+            self.assertEqual(report.day_trade_taxes, expected.day_trade_taxes)
+            self.assertEqual(report.positions(), expected.positions())
+            self.assertEqual(report.totals.quantities(), [0, 0, 100])
+            self.assertGreater(report.taxes[1].tax_due, 0.0)
+
+            report.replace(previous)
+            self.assertEqual(report.taxes[1].tax_due, 0.0)
+            self.assertEqual(report.position('ACAO3')['quantidade'], 700)
+
+    def test_what_if_cross_check(self):
+        report = Report(self.current, self.b3input, engine='fixed', cross_check=True)
+        report.prepare()
+        report.replace(report.prepare_stock('ACAO3', []))
+        self.assertEqual(report.mismatches, [])
+        self.assertIsNone(report.position('ACAO3'))
+        self.assertEqual(report.taxes[1].sold, 15000.0)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from datetime import date
+from unittest import TestCase
+
+from taxes import data
+from taxes.file_handlers import load_b3_files
+from taxes.report import Report
+from taxes.store import Store
+from tests.test_file_handlers import write_b3_file
+
+
+class TestStore(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = Store(os.path.join(self.tmpdir.name, 'trades.sqlite'))
+        self.export = os.path.join(self.tmpdir.name, 'negociacao.xlsx')
+        write_b3_file(
+            self.export,
+            [
+                ('02/01/2023', 'Compra', 'STOC4', 100, 1.5),
+                ('03/01/2023', 'Compra', 'ACAO3', 10, 20.0),
+                ('02/02/2023', 'Venda', 'STOC4', 50, 2.0),
+                ('02/02/2023', 'Compra', 'STOC4', 10, 1.9),
+                ('05/06/2023', 'Venda', 'STOC4', 20, 1.0),
+            ],
+        )
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_ingest_once(self):
+        self.assertEqual(self.store.ingest(self.export, cache=False), 5)
+        self.assertEqual(self.store.ingest(self.export, cache=False), 0)
+        # another account has its own trades
+        self.assertEqual(self.store.ingest(self.export, 'other', cache=False), 5)
+        self.assertEqual(self.store.accounts(), ['default', 'other'])
+
+    def test_same_operations_as_the_export(self):
+        self.store.ingest(self.export, cache=False)
+        self.assertEqual(self.store.years(), [2023])
+        self.assertEqual(
+            self.store.operations(), load_b3_files([self.export], cache=False)
+        )
+
+    def test_sells(self):
+        self.store.ingest(self.export, cache=False)
+        self.assertEqual(
+            self.store.sells('STOC4', 2023),
+            [
+                data.Sell('STOC4', 50, 2.0, date(2023, 2, 2)),
+                data.Sell('STOC4', 20, 1.0, date(2023, 6, 5)),
+            ],
+        )
+        self.assertEqual(self.store.sells('STOC4', 2022), [])
+
+    def test_stock_queries_use_the_index(self):
+        plan = self.store.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM trades '
+            'WHERE account = ? AND stock = ? AND date BETWEEN ? AND ?',
+            ('default', 'STOC4', 0, 1),
+        ).fetchall()
+        self.assertIn('trades_account_stock_date', ' '.join(row[-1] for row in plan))
+
+    def test_report_from_the_store(self):
+        self.store.add_operations(
+            [
+                data.Buy('STOC4', 10, 10.0, date(2023, 1, 2)),
+                data.Sell('STOC4', 5, 12.0, date(2023, 3, 1)),
+            ]
+        )
+        report = Report({}, self.store.operations(year=2023))
+        report.prepare()
+        self.store.save_results(report)
+        # saved again, replacing the previous results
+        self.store.save_results(report)
+
+        results = self.store.results(2023, stock='STOC4')
+        self.assertEqual(len(results['STOC4']), 12)
+        self.assertEqual(results['STOC4'][2], (60.0, 10.0, 0.0))
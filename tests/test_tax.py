@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from taxes import tax
+
+NO_SALES = [0.0] * 12
+
+
+def months(**values):
+    """12 months list, with values given by month name like feb=10.0"""
+    names = 'jan feb mar apr may jun jul aug sep oct nov dec'.split()
+    return [values.get(name, 0.0) for name in names]
+
+
+class TestAssess(TestCase):
+    def test_no_operations(self):
+        taxes = tax.assess(NO_SALES, NO_SALES)
+        self.assertEqual(len(taxes), 12)
+        self.assertFalse(any(month.tax_due for month in taxes))
+
+    def test_exempt_gain(self):
+        taxes = tax.assess(months(feb=20000.0), months(feb=1000.0))
+        self.assertEqual(taxes[1].exempt, 1000.0)
+        self.assertEqual(taxes[1].taxable, 0.0)
+        self.assertEqual(taxes[1].tax_due, 0.0)
+
+    def test_taxable_gain(self):
+        taxes = tax.assess(months(feb=20000.01), months(feb=1000.0))
+        self.assertEqual(taxes[1].exempt, 0.0)
+        self.assertEqual(taxes[1].taxable, 1000.0)
+        self.assertEqual(taxes[1].tax_due, 150.0)
+        # nothing compensated, not even -0.0
+        self.assertEqual(str(taxes[1].compensated), '0.0')
+
+    def test_loss_carried_forward(self):
+        taxes = tax.assess(
+            months(jan=5000.0, mar=30000.0, may=30000.0),
+            months(jan=-600.0, mar=1000.0, may=1000.0),
+        )
+        self.assertEqual(taxes[0].accumulated_loss, -600.0)
+        self.assertEqual(taxes[1].accumulated_loss, -600.0)
+        self.assertEqual(taxes[2].compensated, 600.0)
+        self.assertEqual(taxes[2].taxable, 400.0)
+        self.assertEqual(taxes[2].tax_due, 60.0)
+        self.assertEqual(taxes[2].accumulated_loss, 0.0)
+        self.assertEqual(taxes[4].taxable, 1000.0)
+
+    def test_exempt_gain_does_not_use_loss(self):
+        taxes = tax.assess(
+            months(jan=5000.0, feb=5000.0), months(jan=-600.0, feb=1000.0)
+        )
+        self.assertEqual(taxes[1].exempt, 1000.0)
+        self.assertEqual(taxes[-1].accumulated_loss, -600.0)
+
+    def test_previous_loss(self):
+        taxes = tax.assess(
+            months(jan=50000.0), months(jan=1000.0), accumulated_loss=-1500.0
+        )
+        self.assertEqual(taxes[0].taxable, 0.0)
+        self.assertEqual(taxes[0].accumulated_loss, -500.0)
+
+    def test_no_exemption(self):
+        taxes = tax.assess(months(jan=100.0), months(jan=10.0), exemption_limit=None)
+        self.assertEqual(taxes[0].taxable, 10.0)
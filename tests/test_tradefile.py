@@ -0,0 +1,128 @@
+import os
+import pickle
+import struct
+import tempfile
+from datetime import date
+from fractions import Fraction
+from unittest import TestCase
+
+from taxes import data
+from taxes.events import SPLIT
+from taxes.events import Event
+from taxes.events import EventIndex
+from taxes.fixed import cross_check
+from taxes.report import Report
+from taxes.tradefile import HEADER
+from taxes.tradefile import TradeFile
+from taxes.tradefile import open_trade_file
+from taxes.tradefile import write_trade_file
+
+YEAR = 2023
+
+
+class TestTradeFile(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, f'negociacao.{YEAR}.trades')
+        self.stocks = {
+            'STOC4': [
+                data.Buy('STOC4', 100, 12.37, date(YEAR, 1, 2)),
+                data.Sell('STOC4', 50, 15.01, date(YEAR, 2, 1)),
+                data.Buy('STOC4', 300, 11.11, date(YEAR, 2, 10)),
+                data.Sell('STOC4', 350, 13.0, date(YEAR, 5, 1)),
+            ],
+            'ACAO3': [
+                data.Buy('ACAO3', 7, 33.33, date(YEAR, 1, 5)),
+                data.Sell('ACAO3', 7, 40.123456, date(YEAR, 12, 1)),
+            ],
+            'BOVA11': [data.Buy('BOVA11', 1, 99.99, date(YEAR, 3, 1))],
+        }
+        write_trade_file(self.path, {YEAR: self.stocks})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_operations(self):
+        with TradeFile(self.path) as trade_file:
+            self.assertEqual(trade_file.year, YEAR)
+            self.assertEqual(sorted(trade_file), sorted(self.stocks))
+            for stock, operations in self.stocks.items():
+                trades = trade_file[stock]
+                self.assertEqual(len(trades), len(operations))
+                self.assertEqual(list(trades), operations)
+                self.assertEqual(trades[-1], operations[-1])
+                with self.assertRaises(IndexError):
+                    trades[len(operations)]
+
+    def test_pickled_as_a_reference(self):
+        with TradeFile(self.path) as trade_file:
+            trades = trade_file['STOC4']
+            pickled = pickle.dumps(trades)
+            self.assertLess(len(pickled), 200)
+            self.assertEqual(list(pickle.loads(pickled)), self.stocks['STOC4'])
+
+    def test_report_in_workers(self):
+        expected = Report({}, {YEAR: self.stocks})
+        expected.prepare()
+        with TradeFile(self.path) as trade_file:
+            report = Report({}, trade_file.b3input(), workers=2)
+            report.prepare()
+            self.assertEqual(report.positions(), expected.positions())
+            self.assertEqual(
+                report.totals.results_by_month(), expected.totals.results_by_month()
+            )
+
+    def test_year_from_columns(self):
+        stocks = {
+            'STOC4': [
+                data.Buy('STOC4', 100, 12.37, date(YEAR, 1, 2)),
+                # day trades, with a buy and a sell remainder
+                data.Buy('STOC4', 30, 13.11, date(YEAR, 2, 1)),
+                data.Sell('STOC4', 50, 15.01, date(YEAR, 2, 1)),
+                data.Buy('STOC4', 70, 12.9, date(YEAR, 2, 1)),
+                data.Sell('STOC4', 20, 13.33, date(YEAR, 2, 3)),
+                data.Buy('STOC4', 10, 13.0, date(YEAR, 2, 3)),
+                data.Sell('STOC4', 40, 14.2, date(YEAR, 6, 1)),
+                data.Sell('STOC4', 10, 14.3, date(YEAR, 6, 1)),
+            ],
+            'ACAO3': [
+                data.Buy('ACAO3', 7, 33.33, date(YEAR, 1, 5)),
+                data.Sell('ACAO3', 7, 33.5, date(YEAR, 1, 5)),
+            ],
+        }
+        write_trade_file(self.path, {YEAR: stocks})
+        current = {'STOC4': {'total': 1000.0, 'preco-medio': 10.0, 'quantidade': 100}}
+        events = EventIndex([Event('STOC4', date(YEAR, 2, 3), SPLIT, Fraction(2))])
+        expected = Report(current, {YEAR: stocks}, events=events)
+        expected.prepare()
+        with TradeFile(self.path) as trade_file:
+            report = Report(current, trade_file.b3input(), events=events)
+            report.prepare()
+            for year in report.stocks:
+                other = expected.stock(year.stock)
+                self.assertEqual(year.state(), other.state())
+                self.assertEqual(year.day_trades, other.day_trades)
+                self.assertEqual(year.operation_results, other.operation_results)
+                self.assertEqual(list(year.operations), other.operations)
+                self.assertEqual(cross_check(year), [])
+
+    def test_rewritten_file_mapped_again(self):
+        self.assertEqual(len(open_trade_file(self.path)['STOC4']), 4)
+        stocks = dict(self.stocks, STOC4=self.stocks['STOC4'][:1])
+        write_trade_file(self.path, {YEAR: stocks})
+        self.assertEqual(len(open_trade_file(self.path)['STOC4']), 1)
+
+    def test_not_a_trade_file(self):
+        with open(self.path, 'r+b') as file:
+            file.write(struct.pack('<8s', b'whatever'))
+        with self.assertRaises(ValueError):
+            TradeFile(self.path)
+
+    def test_other_byteorder(self):
+        with open(self.path, 'r+b') as file:
+            header = list(HEADER.unpack(file.read(HEADER.size)))
+            header[3] = b'>' if header[3] == b'<' else b'<'
+            file.seek(0)
+            file.write(HEADER.pack(*header))
+        with self.assertRaises(ValueError):
+            TradeFile(self.path)
@@ -0,0 +1,74 @@
+from datetime import date
+from unittest import TestCase
+from unittest import skipIf
+
+from taxes import data
+from taxes.report import Report
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+YEAR = 2023
+
+
+def day(month):
+    return date(day=1, month=month, year=YEAR)
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class TestEnginesMatch(TestCase):
+    def setUp(self):
+        self.current = {
+            'STOC4': {'total': 1000.0, 'preco-medio': 10.0, 'quantidade': 100},
+            'HOLD3': {'total': 333.33, 'preco-medio': 3.3333, 'quantidade': 100},
+        }
+        self.b3input = {
+            YEAR: {
+                'STOC4': [
+                    data.Buy('STOC4', 100, 12.37, day(1)),
+                    data.Sell('STOC4', 50, 15.01, day(2)),
+                    data.Sell('STOC4', 30, 9.99, day(2)),
+                    data.Buy('STOC4', 300, 11.11, day(3)),
+                    data.Sell('STOC4', 10, 9.0, date(YEAR, 3, 20)),
+                    data.Buy('STOC4', 10, 12.0, date(YEAR, 3, 21)),
+                    data.Sell('STOC4', 420, 13.0, day(5)),
+                ],
+                'ACAO3': [
+                    data.Buy('ACAO3', 7, 33.33, day(1)),
+                    data.Buy('ACAO3', 13, 31.7, day(4)),
+                    data.Sell('ACAO3', 10, 29.9, day(6)),
+                    data.Sell('ACAO3', 5, 40.0, day(12)),
+                ],
+                'ZERO11': [
+                    data.Buy('ZERO11', 1, 99.99, day(7)),
+                    data.Sell('ZERO11', 1, 120.0, day(8)),
+                ],
+            }
+        }
+
+    def prepare(self, engine):
+        report = Report(self.current, self.b3input, engine=engine)
+        report.prepare()
+        return report
+
+    def test_same_results(self):
+        python = self.prepare('python')
+        vectorized = self.prepare('numpy')
+        for name in ('sold_by_month', 'results_by_month', 'averages'):
+            for expected, value in zip(
+                getattr(python.totals, name)(), getattr(vectorized.totals, name)()
+            ):
+                self.assertAlmostEqual(expected, value, places=9)
+        self.assertEqual(python.totals.quantities(), vectorized.totals.quantities())
+        for expected, tax in zip(python.taxes, vectorized.taxes):
+            for name in ('sold', 'result', 'exempt', 'taxable', 'accumulated_loss'):
+                self.assertAlmostEqual(
+                    getattr(expected, name), getattr(tax, name), places=9
+                )
+            self.assertEqual(expected.tax_due, tax.tax_due)
+
+    def test_invalid_engine(self):
+        with self.assertRaises(AssertionError):
+            Report(self.current, self.b3input, engine='fortran')